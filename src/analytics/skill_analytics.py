@@ -0,0 +1,136 @@
+import os
+import pickle
+from typing import Tuple
+from sqlalchemy import Connection, func, select
+from models.vacancy import Skill, Vacancy, vacancy_skill
+from datastore.sqlite_datastore import engine
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class SkillAnalytics:
+    """
+    Skill statistics over all stored vacancies: how many vacancies require
+    every skill, which skills are required together and what share of the
+    vacancies of every company requires a skill
+    """
+
+    fingerprint: Tuple[int, ...]
+    frequency: any
+    cooccurrence: any
+    company_profiles: any
+
+    def __init__(self, fingerprint: Tuple[int, ...], frequency, cooccurrence, company_profiles) -> None:
+        self.fingerprint = fingerprint
+        self.frequency = frequency
+        self.cooccurrence = cooccurrence
+        self.company_profiles = company_profiles
+
+
+def skill_analytics(refresh: bool = False) -> SkillAnalytics:
+    """
+    Returns analytics of the stored vacancies, results are cached on disk
+    and computed again only when the stored vacancies change
+    """
+    cache_file = os.path.join(configuration.property(
+        "analytics.cache-path", "./.cache/analytics"), "skill-analytics.pkl")
+    with engine.connect() as connection:
+        fingerprint = _fingerprint(connection)
+        if not refresh and os.path.exists(cache_file):
+            with open(cache_file, "rb") as stream:
+                analytics: SkillAnalytics = pickle.load(stream)
+            if analytics.fingerprint == fingerprint:
+                log.info("Using cached skill analytics")
+                return analytics
+
+        analytics = _compute(connection, fingerprint)
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, "wb") as stream:
+        pickle.dump(analytics, stream)
+    return analytics
+
+
+def _fingerprint(connection: Connection) -> Tuple[int, ...]:
+    vacancy_table = Vacancy.__table__
+    vacancies, last_vacancy_id, last_fetched_at = connection.execute(select(
+        func.count(), func.max(vacancy_table.c.id), func.max(vacancy_table.c.fetched_at))).one()
+    vacancy_skills, last_skill_id = connection.execute(select(
+        func.count(), func.max(vacancy_skill.c.skill_id))).one()
+    return (vacancies, last_vacancy_id, str(last_fetched_at), vacancy_skills, last_skill_id)
+
+
+def _compute(connection: Connection, fingerprint: Tuple[int, ...]) -> SkillAnalytics:
+    # NOTE: pandas and numpy are optional, so they are imported only when analytics are computed
+    import numpy as np
+    import pandas as pd
+
+    vacancies = _frame(pd, connection, select(Vacancy.__table__.c.id, Vacancy.__table__.c.company)).set_index("id")
+    skills = _frame(pd, connection, select(Skill.__table__.c.id, Skill.__table__.c.name)).set_index("id")["name"]
+    pairs = _frame(pd, connection, select(vacancy_skill.c.vacancy_id, vacancy_skill.c.skill_id))
+    log.info("Loaded %s vacancies with %s skills", len(vacancies), len(pairs))
+
+    total_vacancies = max(1, len(vacancies))
+    skill_ids = pairs["skill_id"].to_numpy()
+    vacancy_ids = pairs["vacancy_id"].to_numpy()
+
+    # NOTE: skills and vacancies are remapped to dense codes, so counting is a bincount
+    skill_codes, skill_index = pd.factorize(skill_ids, sort=True)
+    counts = np.bincount(skill_codes, minlength=len(skill_index))
+    frequency = pd.DataFrame({"skill": skills.reindex(skill_index).to_numpy(), "vacancies": counts,
+                              "share": counts / total_vacancies}).sort_values("vacancies", ascending=False, ignore_index=True)
+
+    # NOTE: skill pairs of the same vacancy come from a self join of the sorted pairs,
+    # the pair is encoded as a single integer and counted with unique
+    order = np.lexsort((skill_codes, vacancy_ids))
+    sorted_vacancies, sorted_skills = vacancy_ids[order], skill_codes[order]
+    left, right = _same_group_pairs(np, sorted_vacancies)
+    pair_codes = sorted_skills[left].astype(
+        np.int64) * len(skill_index) + sorted_skills[right]
+    pair_codes, pair_counts = np.unique(pair_codes, return_counts=True)
+    first, second = np.divmod(pair_codes, len(skill_index))
+    cooccurrence = pd.DataFrame({
+        "skill": skills.reindex(skill_index[first]).to_numpy(),
+        "other_skill": skills.reindex(skill_index[second]).to_numpy(),
+        "vacancies": pair_counts,
+        "jaccard": pair_counts / (counts[first] + counts[second] - pair_counts)
+    }).sort_values("vacancies", ascending=False, ignore_index=True)
+
+    company_pairs = pd.DataFrame({"company": vacancies["company"].reindex(vacancy_ids).to_numpy(),
+                                  "skill": skills.reindex(skill_ids).to_numpy()})
+    company_profiles = company_pairs.groupby(
+        ["company", "skill"]).size().rename("vacancies").reset_index()
+    company_profiles["company_vacancies"] = vacancies.groupby(
+        "company").size().reindex(company_profiles["company"]).to_numpy()
+    company_profiles["share"] = company_profiles["vacancies"] / \
+        company_profiles["company_vacancies"]
+    company_profiles = company_profiles.sort_values(
+        ["company", "vacancies"], ascending=[True, False], ignore_index=True)
+
+    return SkillAnalytics(fingerprint, frequency, cooccurrence, company_profiles)
+
+
+def _frame(pd, connection: Connection, query):
+    result = connection.execute(query)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+
+def _same_group_pairs(np, groups):
+    """
+    Returns index pairs i < j of equal neighbouring values in a sorted array
+    """
+    if not len(groups):
+        return (np.empty(0, np.int64), np.empty(0, np.int64))
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    lefts, rights = [], []
+    for size in np.unique(sizes[sizes > 1]):
+        group_starts = starts[sizes == size]
+        left, right = np.triu_indices(size, k=1)
+        lefts.append((group_starts[:, None] + left).ravel())
+        rights.append((group_starts[:, None] + right).ravel())
+    if not lefts:
+        return (np.empty(0, np.int64), np.empty(0, np.int64))
+    return (np.concatenate(lefts), np.concatenate(rights))
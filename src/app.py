@@ -1,31 +1,113 @@
 import argparse
 import asyncio
+import json
+from sqlalchemy.exc import OperationalError
 from logging_utils import logger, time_and_log
-from provider.hh_dataprovider import each_vacancy
-from datastore.sqlite_datastore import save_all, initialize
+from provider.crawl_scheduler import each_scheduled_vacancy, search_queries
+from provider.crawl_checkpoint import clear_checkpoints
+from provider.crawl_workers import CrawlWorkers
+from provider.hh_dataprovider import each_enriched_vacancy
+from datastore.sqlite_datastore import archive_vacancies, known_vacancies, initialize, lite_vacancies, near_duplicate_index, save_signatures, search_vacancies
+from datastore.near_duplicates import each_unique_vacancy
+from datastore.vacancy_writer import VacancyWriter
+from datastore.parquet_export import export_parquet
+from analytics.skill_analytics import skill_analytics
+from metrics import metrics, profiled, serve_metrics
 
 from config.provider import configuration
 
 log = logger(__name__)
 
 
-async def main(use_api: bool):
-    vacancies = []
+async def main(use_api: bool, incremental: bool = False, workers: int = 1, lite: bool = False, profile_path: str = None, resume: bool = False):
+    if not resume:
+        clear_checkpoints()
+    known = None
+    if incremental:
+        known = known_vacancies(configuration.property(
+            "incremental.vacancy-ttl-in-seconds", 24*60*60))
+    elif resume:
+        # NOTE: the database was kept, so everything stored comes from the interrupted crawl
+        known = known_vacancies(-1)
+    prefetch_size = configuration.property("vacancy-prefetch", 50)
+    index = near_duplicate_index() if configuration.property(
+        "near-duplicates.enabled", False) else None
     try:
-        async for vacancy in each_vacancy(configuration.property("vacancy-search-query", "middle python developer"),
-                                         configuration.property(
-                "vacancy-limit", 100),
-                configuration.property(
-                "vacancy-prefetch", 50),
-                use_api):
-            vacancies.append(vacancy)
-        log.info("Fetched total %s vacancies", len(vacancies))
-        try:
-            save_all(vacancies)
-        except Exception as ex:
-            log.error("Could not persist vacancies", ex)
+        with profiled(profile_path) as report:
+            if workers > 1:
+                # NOTE: workers are forked before the writer thread is started
+                with CrawlWorkers(workers, search_queries(), prefetch_size, use_api, known, lite, resume) as crawl_workers:
+                    await _persist(_unique(crawl_workers.each_vacancy(), index))
+            else:
+                await _persist(_unique(each_scheduled_vacancy(search_queries(), prefetch_size, use_api, known, lite=lite, resume=resume), index))
+        if report:
+            log.info("Crawl profile is saved to %s\n%s",
+                     profile_path, report.getvalue())
     except Exception as ex:
-        log.error("Could not fetch vacancies cause", ex)
+        log.error("Could not fetch vacancies cause %s", ex)
+    finally:
+        if index:
+            save_signatures(index)
+
+
+async def enrich():
+    """
+    Deferred pass fetching skills and full description of lite vacancies
+    """
+    removed = []
+    try:
+        vacancies = lite_vacancies(
+            configuration.property("lite.enrich-limit"))
+        log.info("Enriching %s lite vacancies", len(vacancies))
+        await _persist(each_enriched_vacancy(vacancies, configuration.property("vacancy-prefetch", 50), removed=removed))
+    except Exception as ex:
+        log.error("Could not enrich vacancies cause %s", ex)
+    finally:
+        if removed:
+            archive_vacancies(removed)
+            log.info("Archived %s vacancies removed from hh", len(removed))
+
+
+def analyze(top: int):
+    analytics = skill_analytics()
+    profiles = analytics.company_profiles
+    top_companies = profiles.drop_duplicates("company").nlargest(
+        top, "company_vacancies")["company"]
+    print("Most required skills", analytics.frequency.head(top).to_string(index=False),
+          "Skills required together", analytics.cooccurrence.head(
+              top).to_string(index=False),
+          "Skills of companies with most vacancies", profiles[profiles["company"].isin(
+              top_companies)].groupby("company").head(top).to_string(index=False),
+          sep="\n\n")
+
+
+def search(query: str, limit: int):
+    try:
+        for internal_id, company, carrier_position, rank, snippet in search_vacancies(query, limit):
+            print(f"{internal_id}\t{rank:.2f}\t{carrier_position} at {company}\n\t{' '.join(snippet.split())}")
+    except OperationalError as ex:
+        log.error("Could not search vacancies by %s cause %s", query, ex.orig)
+
+
+def _unique(vacancies, index):
+    return each_unique_vacancy(vacancies, index) if index else vacancies
+
+
+def _report_metrics():
+    summary = json.dumps(metrics.summary(), indent=2)
+    log.info("Crawl metrics %s", summary)
+    summary_path = configuration.property("metrics.summary-path")
+    if summary_path:
+        with open(summary_path, "w") as summary_file:
+            summary_file.write(summary)
+
+
+async def _persist(vacancies):
+    async with VacancyWriter() as writer:
+        total = await writer.consume(vacancies)
+        log.info("Fetched total %s vacancies", total)
+    if writer.total_failed:
+        log.error("Could not persist %s vacancies", writer.total_failed)
 
 
 @time_and_log
@@ -34,9 +116,47 @@ def app_runner():
         prog='HeadHunter Vacancy Parser',
         description='The program will parse vancancies and saves it to the datastore using api or html crawlers')
     parser.add_argument('-api', '--useapi', action='store_true', default=False)
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        default=configuration.property("incremental.enabled", False))
+    parser.add_argument('-w', '--workers', type=int,
+                        default=configuration.property("workers", 1))
+    parser.add_argument('-l', '--lite', action='store_true',
+                        default=configuration.property("lite.enabled", False))
+    parser.add_argument('-e', '--enrich', action='store_true', default=False)
+    parser.add_argument('-x', '--export', metavar='PATH', default=None)
+    parser.add_argument('-a', '--analytics', action='store_true', default=False)
+    parser.add_argument('-s', '--search', metavar='QUERY', default=None)
+    parser.add_argument('-r', '--resume', action='store_true', default=False)
+    parser.add_argument('-p', '--profile', metavar='PATH',
+                        default=configuration.property("profile.path"))
     args = parser.parse_args()
-    initialize()
-    asyncio.run(main(args.useapi))
+    if args.lite and not args.useapi:
+        parser.error("lite crawl is supported by api crawler only")
+    if args.search:
+        initialize(True)
+        search(args.search, configuration.property("search-limit", 20))
+        return
+    if args.analytics:
+        initialize(True)
+        analyze(configuration.property("analytics.top", 20))
+        return
+    if args.export:
+        initialize(True)
+        export_parquet(args.export)
+        return
+    metrics_port = configuration.property("metrics.port")
+    if metrics_port:
+        serve_metrics(metrics_port)
+    try:
+        if args.enrich:
+            initialize(True)
+            asyncio.run(enrich())
+            return
+        initialize(args.incremental or args.resume)
+        asyncio.run(main(args.useapi, args.incremental,
+                    args.workers, args.lite, args.profile, args.resume))
+    finally:
+        _report_metrics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import multiprocessing
+import resource
+from json import dumps
+from multiprocessing.connection import Connection
+from time import monotonic, process_time
+from typing import Dict, List
+from urllib.parse import urlsplit
+from aiohttp import TraceConfig
+from bench.fixtures import ENDPOINT_PROPERTIES, FixtureServer, FixtureStore
+from provider.fetch_engine import FetchEngine
+from provider.hh_dataprovider import each_vacancy
+from logging_utils import logger, share_with_child_processes
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class RequestTimings:
+    """
+    Collects client side latency of search and detail requests
+    """
+
+    _search_paths: List[str]
+    _latencies: Dict[str, List[float]]
+
+    def __init__(self) -> None:
+        self._search_paths = [urlsplit(configuration.property(name)).path for name in [
+            "hh-search-endpoint", "hh-api-endpoint"]]
+        self._latencies = {"search": [], "detail": []}
+
+    def trace_config(self) -> TraceConfig:
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        return trace_config
+
+    def latencies(self, kind: str) -> List[float]:
+        return self._latencies.get(kind)
+
+    async def _on_request_start(self, session, context, params):
+        context.started_at = monotonic()
+
+    async def _on_request_end(self, session, context, params):
+        kind = "search" if params.url.path in self._search_paths else "detail"
+        self._latencies[kind].append(monotonic() - context.started_at)
+
+
+class FixtureServerProcess:
+    """
+    Replays fixtures from a separate process, so the server neither competes with
+    the crawler for its event loop nor counts towards its cpu time and peak rss
+    """
+
+    _path: str
+    _latency_in_ms: float
+    _jitter_in_ms: float
+    _error_rate: float
+    _process: multiprocessing.Process = None
+    _connection: Connection = None
+    _endpoints: Dict[str, str]
+
+    def __init__(self, path: str, latency_in_ms: float = 0, jitter_in_ms: float = 0, error_rate: float = 0) -> None:
+        self._path = path
+        self._latency_in_ms = latency_in_ms
+        self._jitter_in_ms = jitter_in_ms
+        self._error_rate = error_rate
+        self._endpoints = {}
+
+    async def __aenter__(self):
+        share_with_child_processes()
+        self._connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve_fixtures, name="fixture-server",
+                                                args=(self._path, self._latency_in_ms, self._jitter_in_ms, self._error_rate, child_connection))
+        self._process.start()
+        # NOTE: otherwise receiving would never fail if the server process dies
+        child_connection.close()
+        self._endpoints = await asyncio.to_thread(self._connection.recv)
+        return self
+
+    async def __aexit__(self, *args):
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        self._connection.close()
+
+    def use_for_crawling(self):
+        """
+        Points configured hh endpoints to the server process
+        """
+        for name, url in self._endpoints.items():
+            configuration[name] = url
+
+    async def stop(self) -> int:
+        """
+        Stops the server and returns the amount of injected errors
+        """
+        self._connection.send(None)
+        return await asyncio.to_thread(self._connection.recv)
+
+
+def _serve_fixtures(path: str, latency_in_ms: float, jitter_in_ms: float, error_rate: float, connection: Connection):
+    asyncio.run(_replay_fixtures(path, latency_in_ms,
+                jitter_in_ms, error_rate, connection))
+
+
+async def _replay_fixtures(path: str, latency_in_ms: float, jitter_in_ms: float, error_rate: float, connection: Connection):
+    async with FixtureServer(FixtureStore(path), latency_in_ms=latency_in_ms, jitter_in_ms=jitter_in_ms,
+                             error_rate=error_rate) as server:
+        server.use_for_crawling()
+        connection.send({name: configuration.property(name)
+                        for name in ENDPOINT_PROPERTIES})
+        await asyncio.to_thread(connection.recv)
+        connection.send(server.injected_errors)
+
+
+def percentile(values: List[float], rank: float) -> float:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(rank / 100 * (len(ordered) - 1))))]
+
+
+async def run(path: str, search_query: str, limit: int, prefetch_size: int, use_api: bool,
+              latency_in_ms: float, jitter_in_ms: float, error_rate: float) -> Dict[str, any]:
+    async with FixtureServerProcess(path, latency_in_ms=latency_in_ms, jitter_in_ms=jitter_in_ms,
+                                    error_rate=error_rate) as server:
+        server.use_for_crawling()
+        timings = RequestTimings()
+
+        cpu_started_at = process_time()
+        started_at = monotonic()
+        total = 0
+        async with FetchEngine(trace_configs=[timings.trace_config()]) as engine:
+            async for _ in each_vacancy(search_query, limit, prefetch_size, use_api, engine=engine):
+                total += 1
+        tooks = monotonic() - started_at
+        cpu_seconds = process_time() - cpu_started_at
+
+        # NOTE: the server process is still running, so children usage covers parser workers only
+        own_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        detail_latencies = timings.latencies("detail")
+        return {
+            "vacancies": total,
+            "seconds": round(tooks, 3),
+            "vacancies-per-second": round(total / tooks, 2) if tooks else 0,
+            "search-requests": len(timings.latencies("search")),
+            "detail-requests": len(detail_latencies),
+            "detail-latency-p50-ms": round(percentile(detail_latencies, 50) * 1000, 2),
+            "detail-latency-p99-ms": round(percentile(detail_latencies, 99) * 1000, 2),
+            "injected-errors": await server.stop(),
+            "cpu-seconds": round(cpu_seconds, 3),
+            "parser-workers-cpu-seconds": round(children_usage.ru_utime + children_usage.ru_stime, 3),
+            # NOTE: ru_maxrss is reported in kilobytes on linux
+            "peak-rss-in-kb": own_usage.ru_maxrss,
+            "parser-workers-peak-rss-in-kb": children_usage.ru_maxrss
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='HeadHunter Crawler Benchmark',
+        description='Runs the crawler end-to-end against recorded fixtures and reports throughput, latency and resource usage')
+    parser.add_argument('-p', '--path', default="./fixtures")
+    parser.add_argument('-api', '--useapi', action='store_true', default=False)
+    parser.add_argument('--limit', type=int,
+                        default=configuration.property("vacancy-limit", 100))
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.path, configuration.property("vacancy-search-query", "middle python developer"),
+                             args.limit, configuration.property("vacancy-prefetch", 50), args.useapi,
+                             args.latency_ms, args.jitter_ms, args.error_rate))
+    log.info("Benchmark result %s", dumps(result))
+    print(dumps(result, indent=2))
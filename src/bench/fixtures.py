@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import os
+import random
+from hashlib import sha1
+from json import dump, load
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+from aiohttp import ClientSession, web
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+ENDPOINT_PROPERTIES = ["hh-search-endpoint",
+                       "hh-api-endpoint", "hh-vacancy-details-endpoint"]
+
+_RECORDED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+
+class FixtureStore:
+    """
+    Directory of recorded responses, bodies are kept as files and index.json
+    maps upstream host, path and query to the status, headers and body file
+    """
+
+    _path: str
+    _index: Dict[str, Dict[str, any]]
+    _origins: List[str]
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._index = {}
+        self._origins = []
+        index_file = os.path.join(path, "index.json")
+        if os.path.exists(index_file):
+            with open(index_file, "r") as stream:
+                payload = load(stream)
+                self._index = payload.get("responses", {})
+                self._origins = payload.get("origins", [])
+
+    @property
+    def origins(self) -> List[str]:
+        return self._origins
+
+    def add_origin(self, origin: str):
+        if origin not in self._origins:
+            self._origins.append(origin)
+
+    def keys(self) -> List[str]:
+        return list(self._index.keys())
+
+    def get(self, key: str) -> Tuple[int, Dict[str, str], bytes]:
+        response = self._index.get(key, None)
+        if not response:
+            return None
+        with open(os.path.join(self._path, response.get("file")), "rb") as stream:
+            return (response.get("status"), response.get("headers"), stream.read())
+
+    def put(self, key: str, status: int, headers: Dict[str, str], body: bytes):
+        file = sha1(key.encode("utf-8")).hexdigest()
+        with open(os.path.join(self._path, file), "wb") as stream:
+            stream.write(body)
+        self._index[key] = {"status": status,
+                            "headers": headers, "file": file}
+
+    def save(self):
+        os.makedirs(self._path, exist_ok=True)
+        with open(os.path.join(self._path, "index.json"), "w") as stream:
+            dump({"origins": self._origins, "responses": self._index},
+                 stream, indent=2, ensure_ascii=False)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class FixtureServer:
+    """
+    Local stand-in for hh.ru, every upstream url is served under the
+    /{host}/{path} prefix. In record mode requests are proxied upstream and
+    stored, in replay mode they are answered from the store with configurable
+    latency, jitter and error injection
+    """
+
+    _store: FixtureStore
+    _record: bool
+    _latency: float
+    _jitter: float
+    _error_rate: float
+    _host: str
+    _port: int
+    _runner: web.AppRunner = None
+    _session: ClientSession = None
+    _served: int = 0
+    _injected_errors: int = 0
+
+    def __init__(self, store: FixtureStore, record: bool = False, latency_in_ms: float = 0, jitter_in_ms: float = 0,
+                 error_rate: float = 0, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._store = store
+        self._record = record
+        self._latency = latency_in_ms / 1000
+        self._jitter = jitter_in_ms / 1000
+        self._error_rate = error_rate
+        self._host = host
+        self._port = port
+
+    async def __aenter__(self):
+        if self._record:
+            self._session = ClientSession()
+        app = web.Application()
+        app.router.add_route("GET", "/{host}/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *args):
+        await self._runner.cleanup()
+        if self._session:
+            await self._session.close()
+        if self._record:
+            self._store.save()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def served(self) -> int:
+        return self._served
+
+    @property
+    def injected_errors(self) -> int:
+        return self._injected_errors
+
+    def local_url(self, url: str) -> str:
+        parts = urlsplit(url)
+        return f"{self.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+    def use_for_crawling(self):
+        """
+        Points configured hh endpoints to this server
+        """
+        for name in ENDPOINT_PROPERTIES:
+            url = configuration.property(name)
+            parts = urlsplit(url)
+            self._store.add_origin(f"{parts.scheme}://{parts.netloc}")
+            configuration[name] = self.local_url(url)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        key = _fixture_key(request)
+        if self._record:
+            response = await self._proxy(request, key)
+        else:
+            response = await self._replay(key)
+        self._served += 1
+        return response
+
+    async def _proxy(self, request: web.Request, key: str) -> web.Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in [
+            "host", "if-none-match", "if-modified-since", "accept-encoding"]}
+        upstream_url = f"{self._origin(request.match_info.get('host'))}/{request.match_info.get('path')}" + (
+            f"?{request.query_string}" if request.query_string else "")
+        async with self._session.get(upstream_url, headers=headers) as upstream_response:
+            body = await upstream_response.read()
+            recorded_headers = {k: upstream_response.headers.get(
+                k) for k in _RECORDED_HEADERS if k in upstream_response.headers}
+            if upstream_response.status < 500 and upstream_response.status != 429:
+                self._store.put(key, upstream_response.status,
+                                recorded_headers, body)
+            return web.Response(status=upstream_response.status, headers=recorded_headers, body=self._rewrite(body))
+
+    async def _replay(self, key: str) -> web.Response:
+        delay = self._latency + random.uniform(-self._jitter, self._jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._error_rate and random.random() < self._error_rate:
+            self._injected_errors += 1
+            return web.Response(status=503)
+
+        fixture = self._store.get(key)
+        if not fixture:
+            return web.Response(status=404)
+        status, headers, body = fixture
+        return web.Response(status=status, headers=headers, body=self._rewrite(body))
+
+    def _origin(self, host: str) -> str:
+        for origin in self._store.origins:
+            if urlsplit(origin).netloc == host:
+                return origin
+        return f"https://{host}"
+
+    def _rewrite(self, body: bytes) -> bytes:
+        for origin in self._store.origins:
+            body = body.replace(origin.encode(
+                "utf-8"), f"{self.base_url}/{urlsplit(origin).netloc}".encode("utf-8"))
+        return body
+
+
+def _fixture_key(request: web.Request) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query.items()))
+    return f"{request.match_info.get('host')}/{request.match_info.get('path')}" + (f"?{query}" if query else "")
+
+
+async def record(path: str, search_query: str, limit: int, prefetch_size: int, use_api: bool):
+    # NOTE: imported lazily so that replaying fixtures does not depend on the crawler
+    from provider.hh_dataprovider import each_vacancy
+
+    store = FixtureStore(path)
+    os.makedirs(path, exist_ok=True)
+    async with FixtureServer(store, record=True) as server:
+        server.use_for_crawling()
+        total = 0
+        async for _ in each_vacancy(search_query, limit, prefetch_size, use_api):
+            total += 1
+    log.info("Recorded %s responses of %s vacancies to %s",
+             len(store), total, path)
+
+
+async def replay(path: str, latency_in_ms: float, jitter_in_ms: float, error_rate: float, port: int):
+    async with FixtureServer(FixtureStore(path), latency_in_ms=latency_in_ms, jitter_in_ms=jitter_in_ms,
+                             error_rate=error_rate, port=port) as server:
+        for name in ENDPOINT_PROPERTIES:
+            log.info("Serving %s as %s", name,
+                     server.local_url(configuration.property(name)))
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='HeadHunter Fixtures',
+        description='Records hh.ru responses into a fixture directory or replays them with a local server')
+    parser.add_argument('mode', choices=["record", "replay"])
+    parser.add_argument('-p', '--path', default="./fixtures")
+    parser.add_argument('-api', '--useapi', action='store_true', default=False)
+    parser.add_argument('--limit', type=int,
+                        default=configuration.property("vacancy-limit", 100))
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    if args.mode == "record":
+        asyncio.run(record(args.path, configuration.property("vacancy-search-query", "middle python developer"),
+                    args.limit, configuration.property("vacancy-prefetch", 50), args.useapi))
+    else:
+        asyncio.run(replay(args.path, args.latency_ms,
+                    args.jitter_ms, args.error_rate, args.port))
@@ -0,0 +1,55 @@
+import argparse
+import sys
+from email.message import Message
+from typing import Dict, List
+from urllib.parse import urlsplit
+from bench.fixtures import FixtureStore
+from provider.parsers import parse_vacancy_details
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+def compare(path: str, backends: List[str]) -> Dict[str, Dict[str, any]]:
+    """
+    Parses every recorded vacancy details page with each backend, returns
+    outputs by backend of pages which are not parsed identically
+    """
+    parts = urlsplit(configuration.property("hh-vacancy-details-endpoint"))
+    details_prefix = f"{parts.netloc}{parts.path}"
+    store = FixtureStore(path)
+    total, mismatches = 0, {}
+    for key in store.keys():
+        if not key.startswith(details_prefix):
+            continue
+        status, headers, body = store.get(key)
+        if status != 200:
+            continue
+        total += 1
+        content_type = Message()
+        content_type["Content-Type"] = headers.get("Content-Type", "text/html")
+        encoding = content_type.get_content_charset() or "utf-8"
+        outputs = {backend: parse_vacancy_details(body, encoding, backend)
+                   for backend in backends}
+        if any(output != outputs[backends[0]] for output in outputs.values()):
+            mismatches[key] = outputs
+    log.info("Compared %s vacancy details pages, %s are parsed differently",
+             total, len(mismatches))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='HeadHunter Parser Parity',
+        description='Checks that every details parser backend yields the same output for recorded vacancy pages')
+    parser.add_argument('-p', '--path', default="./fixtures")
+    parser.add_argument('--backends', nargs="+",
+                        default=["html.parser", "lxml"])
+    args = parser.parse_args()
+    mismatches = compare(args.path, args.backends)
+    for key, outputs in mismatches.items():
+        print(key)
+        for backend, output in outputs.items():
+            print(f"  {backend}: {output}")
+    sys.exit(1 if mismatches else 0)
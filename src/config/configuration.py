@@ -60,3 +60,10 @@ class Configuration(DataContainer):
 
     def property(self, name: str, default: any = None) -> any:
         return self.get(name, default)
+
+    def has(self, name: str) -> bool:
+        """
+        Tells whether the property is set at all, property falls back to the
+        default on falsy values like zero
+        """
+        return self._get_property_internal(name) is not None
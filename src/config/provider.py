@@ -23,15 +23,84 @@ class ConfigurationProvider:
                 "level": 20,
                 "file-name": "sample-application.log",
                 "max-size-in-bytes": 100*1024*8,
-                "max-part-size-in-bytes": 1024*1024*8
+                "max-part-size-in-bytes": 1024*1024*8,
+                "rate-limit": {
+                    "interval-in-seconds": 1,
+                    "burst": 10
+                }
             },
             "db-name": "vacancies.db",
+            "db-write-batch-size": 100,
             "vacancy-limit": 100,
             "vacancy-prefetch": 50,
+            "vacancy-page-lookahead": 2,
             "vacancy-search-query": "middle python developer",
+            "vacancy-queries": [
+                {"text": "middle python developer"}
+            ],
+            "scheduler": {
+                "parallel-queries": 4
+            },
             "hh-search-endpoint": "https://hh.ru/search/vacancy",
             "hh-api-endpoint": "https://api.hh.ru/vacancies",
-            "hh-vacancy-details-endpoint": "https://hh.ru/vacancy/"
+            "hh-vacancy-details-endpoint": "https://hh.ru/vacancy/",
+            "incremental": {
+                "enabled": False,
+                "vacancy-ttl-in-seconds": 24*60*60
+            },
+            "lite": {
+                "enabled": False,
+                "enrich-limit": 1000
+            },
+            "export": {
+                "row-group-size": 10000,
+                "compression": "zstd"
+            },
+            "dedup": {
+                "kind": "set",
+                "capacity": 1000000,
+                "error-rate": 0.001
+            },
+            "near-duplicates": {
+                "enabled": False,
+                "threshold": 0.9,
+                "permutations": 128,
+                "bands": 16
+            },
+            "checkpoint": {
+                "path": "./.cache/checkpoints"
+            },
+            "search-limit": 20,
+            "analytics": {
+                "cache-path": "./.cache/analytics",
+                "top": 20
+            },
+            "response-cache": {
+                "enabled": False,
+                "path": "./.cache/responses",
+                "max-size-in-bytes": 256*1024*1024
+            },
+            "workers": 1,
+            "parser-workers": 2,
+            "parser-backend": "html.parser",
+            "retry": {
+                "max-attempts": 5,
+                "base-delay-in-seconds": 1,
+                "max-delay-in-seconds": 30
+            },
+            "rate-limits": {
+                "search": {"rate": 2, "burst": 2},
+                "detail": {"rate": 10, "burst": 10},
+                "api": {"rate": 10, "burst": 10}
+            },
+            "fetch": {
+                "concurrency": 10,
+                "connections-per-host": 10,
+                "keepalive-timeout-in-seconds": 30,
+                "dns-cache-ttl-in-seconds": 300,
+                "max-response-size-in-bytes": 4*1024*1024,
+                "oversized-response-policy": "truncate"
+            }
         }
         try:
             with open(f"./{filename}", "w") as stream:
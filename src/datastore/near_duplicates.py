@@ -0,0 +1,127 @@
+import asyncio
+import random
+import re
+from array import array
+from typing import AsyncIterator, Dict, List, Tuple
+from zlib import crc32
+from sqlalchemy import Connection, select
+from sqlalchemy.dialects.sqlite import insert
+from models.vacancy import vacancy_signature
+from models.vacancy_record import VacancyRecord
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+_WORD_PATTERN = re.compile(r"\w+")
+# NOTE: stored signatures are comparable only while permutations stay the same
+_PERMUTATIONS_SEED = 1
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of carrier position and description over word shingles,
+    signatures are split into bands and vacancies sharing a band are compared
+    by the share of equal signature values, which estimates their jaccard similarity
+    """
+
+    _threshold: float
+    _bands: int
+    _rows: int
+    _permutations: List[Tuple[int, int]]
+    _signatures: Dict[int, array]
+    _buckets: List[Dict[int, List[int]]]
+    _pending: Dict[int, array]
+
+    def __init__(self, threshold: float = None, permutations: int = None, bands: int = None) -> None:
+        self._threshold = threshold or configuration.property(
+            "near-duplicates.threshold", 0.9)
+        permutations = permutations or configuration.property(
+            "near-duplicates.permutations", 128)
+        self._bands = bands or configuration.property(
+            "near-duplicates.bands", 16)
+        self._rows = permutations // self._bands
+        generator = random.Random(_PERMUTATIONS_SEED)
+        self._permutations = [(generator.randrange(1, _MERSENNE_PRIME), generator.randrange(0, _MERSENNE_PRIME))
+                              for _ in range(self._rows * self._bands)]
+        self._signatures = {}
+        self._buckets = [{} for _ in range(self._bands)]
+        self._pending = {}
+
+    def load(self, connection: Connection):
+        for internal_id, signature in connection.execute(select(vacancy_signature.c.internal_id, vacancy_signature.c.signature)):
+            self._add(internal_id, array("Q", signature))
+        log.info("Loaded %s vacancy signatures", len(self._signatures))
+
+    def save(self, connection: Connection):
+        if self._pending:
+            statement = insert(vacancy_signature)
+            connection.execute(statement.on_conflict_do_update(index_elements=[vacancy_signature.c.internal_id],
+                                                               set_={"signature": statement.excluded.signature}),
+                               [{"internal_id": internal_id, "signature": signature.tobytes()} for internal_id, signature in self._pending.items()])
+            self._pending = {}
+
+    def signature(self, text: str) -> array:
+        words = _WORD_PATTERN.findall(
+            _HTML_TAG_PATTERN.sub(" ", text).lower())
+        if not words:
+            return None
+        shingles = {crc32(" ".join(words[i:i + 3]).encode("utf-8"))
+                    for i in range(max(1, len(words) - 2))}
+        return array("Q", [min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles) for a, b in self._permutations])
+
+    def duplicate_of(self, vacancy: VacancyRecord) -> int:
+        """
+        Returns internal id of an already indexed near duplicate or indexes the vacancy
+        """
+        signature = self.signature(
+            f"{vacancy.carrier_position or ''} {vacancy.description or ''}")
+        if signature is None:
+            return None
+
+        candidates = set()
+        for band, bucket in zip(self._bands_of(signature), self._buckets):
+            candidates.update(bucket.get(band, []))
+        candidates.discard(vacancy.internal_id)
+        for candidate in candidates:
+            candidate_signature = self._signatures.get(candidate)
+            if sum(a == b for a, b in zip(signature, candidate_signature)) >= self._threshold * len(signature):
+                return candidate
+
+        self._add(vacancy.internal_id, signature)
+        self._pending[vacancy.internal_id] = signature
+        return None
+
+    def _add(self, internal_id: int, signature: array):
+        previous = self._signatures.get(internal_id)
+        if previous is not None:
+            for band, bucket in zip(self._bands_of(previous), self._buckets):
+                bucket.get(band, []).remove(internal_id)
+        self._signatures[internal_id] = signature
+        for band, bucket in zip(self._bands_of(signature), self._buckets):
+            bucket.setdefault(band, []).append(internal_id)
+
+    def _bands_of(self, signature: array) -> List[int]:
+        return [hash(tuple(signature[i:i + self._rows])) for i in range(0, self._rows * self._bands, self._rows)]
+
+
+async def each_unique_vacancy(vacancies: AsyncIterator[VacancyRecord], index: NearDuplicateIndex):
+    """
+    Drops vacancies whose text is a near duplicate of an already seen one,
+    signatures of the passed vacancies are kept by the index for later runs
+    """
+    total_dropped = 0
+    async for vacancy in vacancies:
+        # NOTE: hashing a description takes milliseconds, so it runs off the event loop,
+        # vacancies are still checked one at a time as the index is not thread safe
+        duplicate_of = await asyncio.to_thread(index.duplicate_of, vacancy)
+        if duplicate_of is not None:
+            total_dropped += 1
+            log.info("Vacancy %s is dropped as a near duplicate of %s",
+                     vacancy.internal_id, duplicate_of)
+            continue
+        yield vacancy
+    if total_dropped:
+        log.info("Dropped %s near duplicate vacancies", total_dropped)
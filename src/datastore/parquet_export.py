@@ -0,0 +1,71 @@
+from typing import Dict, List
+from sqlalchemy import select
+from models.vacancy import Skill, Vacancy, vacancy_skill
+from datastore.sqlite_datastore import engine
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+def export_parquet(path: str, row_group_size: int = None) -> int:
+    """
+    Streams stored vacancies into a parquet file, one row group per chunk of
+    vacancies read by id, so memory usage does not depend on the store size.
+    Companies and skills are dictionary encoded, skills are kept as a list of
+    strings since arrow cannot read nested dictionaries back from several row
+    groups, parquet dictionary encodes their pages anyway
+    """
+    # NOTE: pyarrow is optional, so it is imported only when exporting
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    row_group_size = row_group_size or configuration.property(
+        "export.row-group-size", 10000)
+    schema = pa.schema([
+        ("internal_id", pa.int64()),
+        ("company", pa.dictionary(pa.int32(), pa.string())),
+        ("carrier_position", pa.string()),
+        ("description", pa.string()),
+        ("fetched_at", pa.timestamp("us")),
+        ("enriched", pa.bool_()),
+        ("skills", pa.list_(pa.string()))
+    ])
+    vacancy_table = Vacancy.__table__
+
+    total = 0
+    with engine.connect() as connection, pq.ParquetWriter(path, schema,
+                                                          compression=configuration.property("export.compression", "zstd"),
+                                                          use_dictionary=["company", "skills.list.element"]) as writer:
+        last_id = 0
+        while True:
+            rows = connection.execute(select(vacancy_table.c.id, vacancy_table.c.internal_id, vacancy_table.c.company,
+                                             vacancy_table.c.carrier_position, vacancy_table.c.description,
+                                             vacancy_table.c.fetched_at, vacancy_table.c.enriched)
+                                      .where(vacancy_table.c.id > last_id).order_by(vacancy_table.c.id).limit(row_group_size)).all()
+            if not rows:
+                break
+            skills: Dict[int, List[str]] = {}
+            for vacancy_id, name in connection.execute(select(vacancy_skill.c.vacancy_id, Skill.name)
+                                                       .join(Skill, Skill.id == vacancy_skill.c.skill_id)
+                                                       .where(vacancy_skill.c.vacancy_id.between(rows[0].id, rows[-1].id))):
+                skills.setdefault(vacancy_id, []).append(name)
+
+            writer.write_batch(pa.record_batch([
+                pa.array([row.internal_id for row in rows], pa.int64()),
+                pa.array([row.company for row in rows],
+                         pa.string()).dictionary_encode(),
+                pa.array([row.carrier_position for row in rows], pa.string()),
+                pa.array([row.description for row in rows], pa.string()),
+                pa.array([row.fetched_at for row in rows],
+                         pa.timestamp("us")),
+                pa.array([row.enriched is not False for row in rows],
+                         pa.bool_()),
+                pa.array([skills.get(row.id, []) for row in rows],
+                         pa.list_(pa.string()))
+            ], schema=schema), row_group_size=row_group_size)
+            total += len(rows)
+            last_id = rows[-1].id
+    log.info("Exported %s vacancies to %s", total, path)
+    return total
+
@@ -0,0 +1,56 @@
+from threading import Lock
+from typing import Dict, List
+from sqlalchemy import Connection, select
+from sqlalchemy.dialects.sqlite import insert
+from models.vacancy import Skill
+
+
+class SkillDictionary:
+    """
+    In-process intern cache of skill names, every name maps to a single shared
+    Skill instance which knows its id once it is stored in the skill_name table
+    """
+
+    _skills: Dict[str, Skill]
+    _lock: Lock
+
+    def __init__(self) -> None:
+        self._skills = {}
+        self._lock = Lock()
+
+    def skill(self, name: str) -> Skill:
+        name = name.lower()
+        skill = self._skills.get(name, None)
+        if not skill:
+            with self._lock:
+                skill = self._skills.setdefault(name, Skill(name=name))
+        return skill
+
+    def load(self, connection: Connection):
+        with self._lock:
+            for id, name in connection.execute(select(Skill.id, Skill.name)):
+                skill = self._skills.setdefault(name, Skill(name=name))
+                skill.id = id
+
+    def resolve(self, connection: Connection, skills: List[Skill]):
+        """
+        Assigns ids to skills which are not stored yet, unknown names
+        are inserted using a single bulk statement
+        """
+        missing_names = {skill.name for skill in skills if skill.id is None}
+        if not missing_names:
+            return
+
+        skill_table = Skill.__table__
+        connection.execute(insert(skill_table).on_conflict_do_nothing(
+            index_elements=[skill_table.c.name]), [{"name": name} for name in missing_names])
+        with self._lock:
+            for id, name in connection.execute(select(skill_table.c.id, skill_table.c.name).where(skill_table.c.name.in_(missing_names))):
+                skill = self._skills.setdefault(name, Skill(name=name))
+                skill.id = id
+            for skill in skills:
+                if skill.id is None:
+                    skill.id = self._skills.get(skill.name).id
+
+
+skill_dictionary = SkillDictionary()
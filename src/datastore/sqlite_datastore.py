@@ -1,25 +1,197 @@
-from typing import List
-from sqlalchemy import create_engine
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple
+from sqlalchemy import case, create_engine, delete, event, inspect, or_, select, text
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
-from models.vacancy import Base
+from models.vacancy import Base, Skill, Vacancy, vacancy_skill
+from models.vacancy_record import VacancyRecord
+from datastore.skill_dictionary import skill_dictionary
+from datastore import vacancy_search
+from datastore.near_duplicates import NearDuplicateIndex
+from config.provider import configuration
 
-engine = create_engine("sqlite:///vacancies.db")
+_LEGACY_SKILL_TABLE = "skill"
 
+engine = create_engine(
+    f'sqlite:///{configuration.property("db-name", "vacancies.db")}')
 
-def initialize():
-    try:
-        for table in reversed(Base.metadata.sorted_tables):
-            table.drop(engine)
-    except:
-        pass
+_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64*1024
+}
+
+
+@event.listens_for(engine, "connect")
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in _PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def initialize(incremental: bool = False):
+    if not incremental:
+        # NOTE: a database of an older schema misses some of the tables, so only existing ones are dropped
+        with engine.begin() as connection:
+            vacancy_search.drop_index(connection)
+        Base.metadata.drop_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"DROP TABLE IF EXISTS {_LEGACY_SKILL_TABLE}"))
     Base.metadata.create_all(engine)
+    _migrate()
+    with engine.connect() as connection:
+        skill_dictionary.load(connection)
+
+
+def _migrate():
+    inspector = inspect(engine)
+    columns = [column.get("name")
+               for column in inspector.get_columns(Vacancy.__tablename__)]
+    if "fetched_at" not in columns:
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE {Vacancy.__tablename__} ADD COLUMN fetched_at DATETIME"))
+    if "enriched" not in columns:
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE {Vacancy.__tablename__} ADD COLUMN enriched BOOLEAN DEFAULT 1"))
+    if "archived" not in columns:
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE {Vacancy.__tablename__} ADD COLUMN archived BOOLEAN DEFAULT 0"))
+
+    if inspector.has_table(_LEGACY_SKILL_TABLE):
+        # NOTE: skills used to be stored as one row per vacancy and skill pair
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"INSERT OR IGNORE INTO skill_name (name) SELECT DISTINCT name FROM {_LEGACY_SKILL_TABLE}"))
+            connection.execute(text(f"INSERT OR IGNORE INTO vacancy_skill (vacancy_id, skill_id) "
+                                    f"SELECT s.vacancy_id, n.id FROM {_LEGACY_SKILL_TABLE} s JOIN skill_name n ON n.name = s.name"))
+            connection.execute(text(f"DROP TABLE {_LEGACY_SKILL_TABLE}"))
 
+    if not inspector.has_table(vacancy_search.SEARCH_TABLE):
+        with engine.begin() as connection:
+            vacancy_search.create_index(connection)
 
-def save_all(models: List[Base]):
+
+def known_vacancies(ttl_in_seconds: int = 0) -> Set[int]:
+    """
+    Returns internal ids of stored vacancies which are not stale yet,
+    non positive ttl means stored vacancies never get stale
+    """
+    query = select(Vacancy.internal_id)
+    if ttl_in_seconds > 0:
+        query = query.where(Vacancy.fetched_at >= datetime.utcnow() -
+                            timedelta(seconds=ttl_in_seconds))
     with Session(engine) as session:
-        try:
-            session.add_all(models)
-            session.commit()
-        except Exception as ex:
-            session.rollback()
-            raise ex
+        return set(session.scalars(query))
+
+
+def lite_vacancies(limit: int = None) -> List[VacancyRecord]:
+    """
+    Returns stored vacancies which were built from search results only
+    and are not archived
+    """
+    vacancy_table = Vacancy.__table__
+    query = select(vacancy_table.c.internal_id, vacancy_table.c.company, vacancy_table.c.carrier_position,
+                   vacancy_table.c.description).where(vacancy_table.c.enriched == False, vacancy_table.c.archived == False).order_by(vacancy_table.c.id)
+    if limit:
+        query = query.limit(limit)
+    with engine.connect() as connection:
+        return [VacancyRecord(internal_id, company, carrier_position, description, enriched=False)
+                for internal_id, company, carrier_position, description in connection.execute(query)]
+
+
+def save_all(vacancies: List[VacancyRecord]):
+    """
+    Upserts vacancy records by internal id using bulk statements,
+    skills of an already stored vacancy are replaced. A lite vacancy
+    never overwrites the description and skills of an enriched one
+    """
+    vacancies_by_internal_id: Dict[int, VacancyRecord] = {
+        vacancy.internal_id: vacancy for vacancy in vacancies}
+    if not vacancies_by_internal_id:
+        return
+
+    now = datetime.utcnow()
+    vacancy_table = Vacancy.__table__
+
+    # NOTE: skill names are resolved in a separate transaction, so ids cached by
+    # the dictionary stay valid even if the batch itself fails
+    skills: Dict[int, List[Skill]] = {internal_id: [skill_dictionary.skill(name) for name in vacancy.skills]
+                                      for internal_id, vacancy in vacancies_by_internal_id.items()}
+    with engine.begin() as connection:
+        skill_dictionary.resolve(connection, [
+            skill for vacancy_skills in skills.values() for skill in vacancy_skills])
+
+    upsert_statement = insert(vacancy_table)
+    upsert_statement = upsert_statement.on_conflict_do_update(
+        index_elements=[vacancy_table.c.internal_id],
+        set_={**{name: upsert_statement.excluded[name] for name in [
+            "company", "carrier_position", "fetched_at"]},
+            "description": case((upsert_statement.excluded.enriched == True, upsert_statement.excluded.description),
+                                else_=vacancy_table.c.description),
+            "enriched": or_(upsert_statement.excluded.enriched, vacancy_table.c.enriched),
+            "archived": False}
+    )
+
+    with engine.begin() as connection:
+        connection.execute(upsert_statement, [{
+            "company": vacancy.company,
+            "carrier_position": vacancy.carrier_position,
+            "description": vacancy.description,
+            "internal_id": internal_id,
+            "fetched_at": now,
+            "enriched": vacancy.enriched
+        } for internal_id, vacancy in vacancies_by_internal_id.items()])
+
+        vacancy_ids: Dict[int, int] = dict(connection.execute(select(vacancy_table.c.internal_id, vacancy_table.c.id).where(
+            vacancy_table.c.internal_id.in_(vacancies_by_internal_id.keys()))).all())
+        enriched_vacancy_ids = [vacancy_ids.get(internal_id) for internal_id, vacancy in vacancies_by_internal_id.items()
+                                if vacancy.enriched]
+        connection.execute(delete(vacancy_skill).where(
+            vacancy_skill.c.vacancy_id.in_(enriched_vacancy_ids)))
+
+        vacancy_skills = {(vacancy_ids.get(internal_id), skill.id)
+                          for internal_id, vacancy in vacancies_by_internal_id.items() if vacancy.enriched
+                          for skill in skills.get(internal_id)}
+        if vacancy_skills:
+            connection.execute(vacancy_skill.insert(), [{"vacancy_id": vacancy_id, "skill_id": skill_id}
+                                                        for vacancy_id, skill_id in vacancy_skills])
+
+        vacancy_search.update_index(connection, vacancy_ids.values())
+
+
+def archive_vacancies(internal_ids: List[int]):
+    """
+    Marks vacancies removed from hh, a crawl finding them again unarchives them
+    """
+    if internal_ids:
+        vacancy_table = Vacancy.__table__
+        with engine.begin() as connection:
+            connection.execute(vacancy_table.update().where(
+                vacancy_table.c.internal_id.in_(internal_ids)).values(archived=True))
+
+
+def near_duplicate_index() -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    with engine.connect() as connection:
+        index.load(connection)
+    return index
+
+
+def save_signatures(index: NearDuplicateIndex):
+    with engine.begin() as connection:
+        index.save(connection)
+
+
+def search_vacancies(query: str, limit: int = 20) -> List[Tuple[int, str, str, float, str]]:
+    """
+    Full-text search over carrier positions, companies, descriptions and skills
+    of stored vacancies, query uses sqlite fts5 syntax
+    """
+    with engine.connect() as connection:
+        return vacancy_search.search(connection, query, limit)
@@ -0,0 +1,51 @@
+from typing import Iterable, List, Tuple
+from sqlalchemy import Connection, bindparam, text
+
+SEARCH_TABLE = "vacancy_search"
+
+# NOTE: bm25 weights of carrier_position, company, description and skills columns
+_COLUMN_WEIGHTS = (10.0, 2.0, 1.0, 5.0)
+
+_SEARCH_ROWS = ("SELECT v.id, v.carrier_position, v.company, v.description, "
+                "(SELECT group_concat(n.name, ' ') FROM vacancy_skill vs JOIN skill_name n ON n.id = vs.skill_id WHERE vs.vacancy_id = v.id) "
+                "FROM vacancy v")
+
+
+def create_index(connection: Connection):
+    """
+    Creates the full-text index of vacancies and fills it with already stored ones
+    """
+    connection.execute(text(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(carrier_position, company, description, skills, "
+                            f"tokenize = 'unicode61 remove_diacritics 2')"))
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, carrier_position, company, description, skills) {_SEARCH_ROWS}"))
+
+
+def drop_index(connection: Connection):
+    connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def update_index(connection: Connection, vacancy_ids: Iterable[int]):
+    """
+    Reindexes vacancies as they are stored, so it has to run after vacancies and their skills are written
+    """
+    vacancy_ids = list(vacancy_ids)
+    if not vacancy_ids:
+        return
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids").bindparams(
+        bindparam("ids", expanding=True)), {"ids": vacancy_ids})
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE} (rowid, carrier_position, company, description, skills) "
+                            f"{_SEARCH_ROWS} WHERE v.id IN :ids").bindparams(bindparam("ids", expanding=True)), {"ids": vacancy_ids})
+
+
+def search(connection: Connection, query: str, limit: int = 20) -> List[Tuple[int, str, str, float, str]]:
+    """
+    Returns internal id, company, carrier position, rank and description snippet
+    of vacancies matching fts5 query, the best matches go first
+    """
+    return connection.execute(text(f"SELECT v.internal_id, v.company, v.carrier_position, "
+                                   f"bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in _COLUMN_WEIGHTS)}) AS rank, "
+                                   f"snippet({SEARCH_TABLE}, 2, '[', ']', '...', 16) "
+                                   f"FROM {SEARCH_TABLE} JOIN vacancy v ON v.id = {SEARCH_TABLE}.rowid "
+                                   f"WHERE {SEARCH_TABLE} MATCH :query ORDER BY rank LIMIT :limit"),
+                              {"query": query, "limit": limit}).all()
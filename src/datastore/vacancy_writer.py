@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List
+from models.vacancy_record import VacancyRecord
+from datastore.sqlite_datastore import save_all
+from logging_utils import logger
+from metrics import metrics, timer
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class VacancyWriter:
+    """
+    Persists vacancies in batches on a dedicated thread while the crawl goes on,
+    at most one batch is written while the next one is being collected
+    """
+
+    _batch_size: int
+    _batch: List[VacancyRecord]
+    _executor: ThreadPoolExecutor = None
+    _pending: asyncio.Future = None
+    _total_written: int = 0
+    _total_failed: int = 0
+
+    def __init__(self, batch_size: int = None) -> None:
+        self._batch_size = batch_size or configuration.property(
+            "db-write-batch-size", 100)
+        self._batch = []
+
+    async def __aenter__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="vacancy-writer")
+        return self
+
+    async def __aexit__(self, *args):
+        try:
+            await self.flush()
+            await self._wait_pending()
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def total_written(self) -> int:
+        return self._total_written
+
+    @property
+    def total_failed(self) -> int:
+        return self._total_failed
+
+    async def consume(self, vacancies: AsyncIterator[VacancyRecord]) -> int:
+        total = 0
+        async for vacancy in vacancies:
+            await self.write(vacancy)
+            total += 1
+        return total
+
+    async def write(self, vacancy: VacancyRecord):
+        self._batch.append(vacancy)
+        if len(self._batch) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self):
+        await self._wait_pending()
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._pending = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._save, batch)
+
+    async def _wait_pending(self):
+        if self._pending:
+            pending, self._pending = self._pending, None
+            await pending
+
+    def _save(self, batch: List[VacancyRecord]):
+        try:
+            with timer("crawl_db_write_seconds"):
+                save_all(batch)
+            self._total_written += len(batch)
+            metrics.increment("crawl_vacancies_written_total", len(batch))
+        except Exception as ex:
+            self._total_failed += len(batch)
+            metrics.increment("crawl_vacancies_failed_total", len(batch))
+            log.error("Could not persist batch of %s vacancies cause %s",
+                      len(batch), ex)
@@ -1,9 +1,14 @@
 
-from logging import Logger, getLogger, Formatter, StreamHandler
-from logging.handlers import RotatingFileHandler
+import atexit
+import multiprocessing
+import os
+from logging import ERROR, Filter, Handler, Logger, LogRecord, getLogger, Formatter, StreamHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 from sys import stdout
-from time import time
-from typing import Callable
+from threading import Lock
+from time import monotonic, time
+from typing import Callable, Dict, List, Tuple
 from config.provider import configuration
 
 
@@ -18,14 +23,86 @@ def time_and_log(method: Callable):
     return wrapper
 
 
-def logger(name: str) -> Logger:
+class RateLimitFilter(Filter):
+    """
+    Lets through at most burst records of every message template of a logger
+    per interval, errors always pass. The first record let through after
+    suppression tells how many similar records were dropped
+    """
+
+    _interval: float
+    _burst: int
+    _windows: Dict[Tuple[str, str], List[float]]
+    _lock: Lock
+
+    def __init__(self, interval_in_seconds: float, burst: int) -> None:
+        super().__init__()
+        self._interval = interval_in_seconds
+        self._burst = burst
+        self._windows = {}
+        self._lock = Lock()
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno >= ERROR:
+            return True
+        now = monotonic()
+        with self._lock:
+            window = self._windows.setdefault(
+                (record.name, str(record.msg)), [now, 0, 0])
+            if now - window[0] >= self._interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self._burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed and isinstance(record.args, tuple):
+            record.msg = f"{record.msg} (%s similar messages were suppressed)"
+            record.args = (*record.args, suppressed)
+        return True
+
+
+def logger(name: str, rate_limited: bool = False) -> Logger:
+    """
+    Returns the logger writing through the shared queue, rate limited
+    loggers are meant for messages logged per vacancy
+    """
     logger = getLogger(name)
     logger.setLevel(configuration.property("log.level", 20))
-    logger.addHandler(default_log_handler)
-    logger.addHandler(default_log_file_handler)
+    if default_queue_handler not in logger.handlers:
+        logger.addHandler(default_queue_handler)
+    if rate_limited and default_rate_limit_filter not in logger.filters:
+        logger.addFilter(default_rate_limit_filter)
     return logger
 
 
+def share_with_child_processes():
+    """
+    Makes processes forked afterwards send their records to this process
+    through a multiprocessing queue, so only this process writes log files
+    """
+    global _process_queue, _process_listener
+    if _process_queue is None:
+        _process_queue = multiprocessing.Queue(-1)
+        _process_listener = QueueListener(
+            _process_queue, *_handlers, respect_handler_level=True)
+        _process_listener.start()
+        atexit.register(_process_listener.stop)
+
+
+def _after_fork_in_child():
+    global _listener
+    if _process_queue is not None:
+        default_queue_handler.queue = _process_queue
+        _listener = None
+    else:
+        # NOTE: the listener thread of the parent does not exist in the child
+        default_queue_handler.queue = SimpleQueue()
+        _listener = QueueListener(
+            default_queue_handler.queue, *_handlers, respect_handler_level=True)
+        _listener.start()
+
+
 default_log_formatter: Formatter = Formatter(
     fmt="%(asctime)s: [%(levelname)s] [%(processName)-10s] [%(threadName)s] [%(name)s]\t-\t%(message)s")
 default_log_handler: StreamHandler = StreamHandler(stream=stdout)
@@ -42,3 +119,18 @@ default_log_file_handler: StreamHandler = RotatingFileHandler(filename=f'{log_fi
                                                               mode="w", maxBytes=log_max_part_size_in_bytes,
                                                               backupCount=round(log_max_size_in_bytes/log_max_part_size_in_bytes))
 default_log_file_handler.setFormatter(default_log_formatter)
+
+default_rate_limit_filter: RateLimitFilter = RateLimitFilter(configuration.property("log.rate-limit.interval-in-seconds", 1),
+                                                             configuration.property("log.rate-limit.burst", 10))
+
+# NOTE: records are only enqueued by the logging thread, a listener thread does the io
+_handlers: List[Handler] = [default_log_handler, default_log_file_handler]
+default_queue_handler: QueueHandler = QueueHandler(SimpleQueue())
+_listener: QueueListener = QueueListener(
+    default_queue_handler.queue, *_handlers, respect_handler_level=True)
+_listener.start()
+atexit.register(lambda: _listener.stop() if _listener else None)
+
+_process_queue: multiprocessing.Queue = None
+_process_listener: QueueListener = None
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,222 @@
+import cProfile
+import copy
+import inspect
+import pstats
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from threading import Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Tuple
+
+_LATENCY_BUCKETS_IN_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05,
+                               0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, quantiles are estimated
+    by the upper bound of the bucket they fall into
+    """
+
+    _buckets: List[float]
+    _counts: List[int]
+    _count: int = 0
+    _sum: float = 0
+
+    def __init__(self, buckets: List[float] = _LATENCY_BUCKETS_IN_SECONDS) -> None:
+        self._buckets = list(buckets)
+        self._counts = [0] * (len(self._buckets) + 1)
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(self._buckets) and value > self._buckets[index]:
+            index += 1
+        self._counts[index] += 1
+        self._count += 1
+        self._sum += value
+
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self._count += other._count
+        self._sum += other._sum
+
+    def quantile(self, rank: float) -> float:
+        if not self._count:
+            return 0
+        cumulative = 0
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            if cumulative >= rank * self._count:
+                return bound
+        return float("inf")
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self._count,
+            "sum": round(self._sum, 6),
+            "mean": round(self._sum / self._count, 6) if self._count else 0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99)
+        }
+
+    def prometheus(self, name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self._count}')
+        lines.append(f"{name}_sum {self._sum}")
+        lines.append(f"{name}_count {self._count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency histograms of crawl stages,
+    safe to update from the event loop, writer and executor threads
+    """
+
+    _counters: Dict[str, float]
+    _histograms: Dict[str, Histogram]
+    _lock: Lock
+
+    def __init__(self) -> None:
+        self._counters = {}
+        self._histograms = {}
+        self._lock = Lock()
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name, None)
+            if not histogram:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> Tuple[Dict[str, float], Dict[str, Histogram]]:
+        """
+        Copies of counters and histograms, which can be sent to another process
+        """
+        with self._lock:
+            return (dict(self._counters), copy.deepcopy(self._histograms))
+
+    def merge(self, counters: Dict[str, float], histograms: Dict[str, Histogram]):
+        """
+        Adds metrics snapshot of another process
+        """
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for name, histogram in histograms.items():
+                if name in self._histograms:
+                    self._histograms[name].merge(histogram)
+                else:
+                    self._histograms[name] = histogram
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def summary(self) -> Dict[str, any]:
+        with self._lock:
+            return {**{name: value for name, value in sorted(self._counters.items())},
+                    **{name: histogram.summary() for name, histogram in sorted(self._histograms.items())}}
+
+    def prometheus(self) -> str:
+        with self._lock:
+            lines = []
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+            for name, histogram in sorted(self._histograms.items()):
+                lines.extend(histogram.prometheus(name))
+            return "\n".join(lines) + "\n"
+
+
+metrics: MetricsRegistry = MetricsRegistry()
+
+
+@contextmanager
+def timer(name: str):
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        metrics.observe(name, monotonic() - started_at)
+
+
+def timed(name: str):
+    """
+    Observes the duration of every call of a function or coroutine in the named histogram
+    """
+    def _timed_wrapper(f: Callable):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def _enclosed_coroutine(*args: any, **kwargs: any) -> any:
+                with timer(name):
+                    return await f(*args, **kwargs)
+            return _enclosed_coroutine
+
+        @wraps(f)
+        def _enclosed_function(*args: any, **kwargs: any) -> any:
+            with timer(name):
+                return f(*args, **kwargs)
+        return _enclosed_function
+    return _timed_wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: any):
+        pass
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves metrics in prometheus text format on /metrics from a daemon thread,
+    so scraping never waits for the event loop
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    Thread(target=server.serve_forever, name="metrics-server",
+           daemon=True).start()
+    return server
+
+
+@contextmanager
+def profiled(path: str = None, top: int = 30):
+    """
+    Profiles the enclosed block with cProfile when path is set, stats are
+    dumped to path and the most expensive calls are returned as text
+    """
+    if not path:
+        yield None
+        return
+    profile = cProfile.Profile()
+    report = StringIO()
+    profile.enable()
+    try:
+        yield report
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        pstats.Stats(profile, stream=report).sort_stats(
+            "cumulative").print_stats(top)
@@ -1,6 +1,12 @@
+from datetime import datetime
 from typing import List
+from sqlalchemy import Column
+from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
+from sqlalchemy import Table
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -11,6 +17,23 @@ class Base(DeclarativeBase):
     pass
 
 
+vacancy_skill = Table(
+    "vacancy_skill",
+    Base.metadata,
+    Column("vacancy_id", ForeignKey("vacancy.id",
+           ondelete="CASCADE"), primary_key=True),
+    Column("skill_id", ForeignKey("skill_name.id"),
+           primary_key=True, index=True)
+)
+
+vacancy_signature = Table(
+    "vacancy_signature",
+    Base.metadata,
+    Column("internal_id", Integer, primary_key=True),
+    Column("signature", LargeBinary, nullable=False)
+)
+
+
 class Vacancy(Base):
     __tablename__ = "vacancy"
 
@@ -19,23 +42,26 @@ class Vacancy(Base):
     carrier_position: Mapped[str] = mapped_column(String(256))
     description: Mapped[str] = mapped_column(String())
     internal_id: Mapped[int] = mapped_column(unique=True)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=True)
+    # NOTE: lite vacancies are built from search results and have no skills and full description yet
+    enriched: Mapped[bool] = mapped_column(
+        default=True, server_default="1", nullable=True)
+    # NOTE: vacancies removed from hh are archived by the enrich pass, so they leave its queue
+    archived: Mapped[bool] = mapped_column(
+        default=False, server_default="0", nullable=True)
 
-    skills: Mapped[List["Skill"]] = relationship(
-        back_populates="vacancy", cascade="all, delete-orphan"
-    )
+    skills: Mapped[List["Skill"]] = relationship(secondary=vacancy_skill)
 
     def __repr__(self) -> str:
         return f"Vacancy(id={self.id!r}, title={self.company!r}, carrier_position={self.carrier_position!r}, internal_id={self.internal_id!r})"
 
 
 class Skill(Base):
-    __tablename__ = "skill"
+    __tablename__ = "skill_name"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(512))
-    vacancy_id: Mapped[int] = mapped_column(ForeignKey("vacancy.id"))
-
-    vacancy: Mapped["Vacancy"] = relationship(back_populates="skills")
+    name: Mapped[str] = mapped_column(String(512), unique=True)
 
     def __repr__(self) -> str:
         return f"Skill(id={self.id!r}, name={self.name!r})"
@@ -0,0 +1,19 @@
+from dataclasses import dataclass, field
+from typing import Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class VacancyRecord:
+    """
+    Plain immutable vacancy produced by crawlers, skills are kept as names.
+    Only the datastore turns records into rows, so the crawl never builds
+    orm instances with their instrumented state
+    """
+
+    internal_id: int
+    company: str
+    carrier_position: str
+    description: str = field(default="", repr=False)
+    skills: Tuple[str, ...] = field(default=(), repr=False)
+    # NOTE: lite vacancies are built from search results and have no skills and full description yet
+    enriched: bool = True
@@ -0,0 +1,84 @@
+import os
+import shutil
+from hashlib import sha1
+from json import dump, dumps, load
+from typing import Dict, List, Set, Tuple
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class CrawlCheckpoint:
+    """
+    Progress of a single query crawl saved after every completed search page,
+    i.e. the next page, the last known page, vacancies counted towards the limit
+    and ids emitted by every page. Vacancies are persisted in batches, so a
+    resumed crawl continues from the first page having an emitted vacancy
+    which never reached the database
+    """
+
+    _path: str
+    _current_page: int = None
+    _last_page: int = None
+    _pages: Dict[int, Tuple[int, List[int]]]
+
+    def __init__(self, *key: any, path: str = None) -> None:
+        self._path = os.path.join(path or configuration.property("checkpoint.path", "./.cache/checkpoints"),
+                                  f"{sha1(dumps(key).encode('utf-8')).hexdigest()}.json")
+        self._pages = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self._path, "r") as stream:
+                state = load(stream)
+            self._current_page = state.get("current_page")
+            self._last_page = state.get("last_page")
+            self._pages = {int(page): (generated, ids)
+                           for page, (generated, ids) in state.get("pages", {}).items()}
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as ex:
+            log.warn("Could not load crawl checkpoint %s cause %s",
+                     self._path, ex)
+            return False
+
+    def resume_point(self, stored_vacancies: Set[int]) -> Tuple[int, int, int]:
+        """
+        Returns the page to continue from, vacancies counted before it and the
+        last known page or None when there is nothing to resume
+        """
+        if self._current_page is None:
+            return None
+        generated = 0
+        for page, (page_generated, ids) in sorted(self._pages.items()):
+            if any(vacancy_id not in stored_vacancies for vacancy_id in ids):
+                return (page, generated, self._last_page)
+            generated += page_generated
+        return (self._current_page, generated, self._last_page)
+
+    def save(self, page: int, generated: int, emitted: List[int], current_page: int, last_page: int):
+        self._pages[page] = (generated, emitted)
+        self._current_page = current_page
+        self._last_page = last_page
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # NOTE: a crash while writing must not leave a broken checkpoint behind
+        with open(f"{self._path}.tmp", "w") as stream:
+            dump({"current_page": current_page, "last_page": last_page,
+                  "pages": self._pages}, stream)
+        os.replace(f"{self._path}.tmp", self._path)
+
+    def complete(self):
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+
+def clear_checkpoints():
+    """
+    Drops checkpoints of previous crawls, a crawl which is not resumed starts over
+    """
+    shutil.rmtree(configuration.property(
+        "checkpoint.path", "./.cache/checkpoints"), ignore_errors=True)
@@ -0,0 +1,120 @@
+import asyncio
+from math import ceil
+from typing import List, Set
+from provider.crawl_checkpoint import CrawlCheckpoint
+from provider.fetch_engine import FetchEngine
+from provider.hh_dataprovider import each_vacancy
+from provider.parsing_stage import ParsingStage
+from provider.response_cache import ResponseCache
+from provider.vacancy_id_set import vacancy_id_set
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class SearchQuery:
+
+    text: str
+    area: str
+    experience: str
+    limit: int
+    first_page: int = 0
+    page_step: int = 1
+
+    def __init__(self, text: str, area: str = None, experience: str = None, limit: int = None, first_page: int = 0, page_step: int = 1) -> None:
+        self.text = text
+        self.area = area
+        self.experience = experience
+        self.limit = limit or configuration.property("vacancy-limit", 100)
+        self.first_page = first_page
+        self.page_step = page_step
+
+    def shard(self, index: int, count: int, page_size: int) -> "SearchQuery":
+        """
+        Returns the part of the query crawling every count-th page starting
+        from index, its limit covers exactly the vacancies of those pages
+        or None when there is nothing to crawl
+        """
+        full_pages, rest = divmod(self.limit, page_size)
+        limit = max(0, (full_pages - index + count - 1) // count) * page_size
+        if rest and full_pages % count == index:
+            limit += rest
+        if not limit:
+            return None
+        return SearchQuery(self.text, self.area, self.experience, limit, index, count)
+
+    def __repr__(self) -> str:
+        return f"SearchQuery(text={self.text}, area={self.area}, experience={self.experience}, limit={self.limit}, pages={self.first_page}::{self.page_step})"
+
+
+def search_queries() -> List[SearchQuery]:
+    """
+    Reads query specs from vacancy-queries, the single vacancy-search-query
+    is used when none are configured
+    """
+    queries = [SearchQuery(spec.property("text"), spec.property("area"), spec.property("experience"), spec.property("limit"))
+               for _, spec in configuration.each("vacancy-queries") if spec.property("text")]
+    if not queries:
+        queries.append(SearchQuery(configuration.property(
+            "vacancy-search-query", "middle python developer")))
+    return queries
+
+
+async def each_scheduled_vacancy(queries: List[SearchQuery], prefetch_size: int, use_api: bool = False, known_vacancies: Set[int] = None,
+                                 parser_workers: int = None, lite: bool = False, resume: bool = False):
+    """
+    Crawls all queries on a single fetch engine, parsing stage and response cache.
+    At most scheduler.parallel-queries crawls run at once and each of them gets
+    an equal share of the fetch concurrency, a vacancy found by several queries
+    is fetched and yielded only once. Progress of every query is checkpointed,
+    resumed crawls continue from their checkpoints
+    """
+    parallel_queries = max(1, min(len(queries), configuration.property(
+        "scheduler.parallel-queries", 4)))
+    seen_vacancies = vacancy_id_set(known_vacancies)
+    vacancies = asyncio.Queue(maxsize=prefetch_size)
+    slots = asyncio.Semaphore(parallel_queries)
+    finished = object()
+
+    async with FetchEngine() as engine:
+        concurrency_per_query = configuration.property(
+            "scheduler.concurrency-per-query", ceil(engine.concurrency / parallel_queries))
+        with ParsingStage(parser_workers) as parsing, ResponseCache() as cache:
+
+            async def crawl(query: SearchQuery):
+                async with slots:
+                    total = 0
+                    checkpoint = CrawlCheckpoint(query.text, query.area, query.experience,
+                                                 query.first_page, query.page_step, use_api, lite)
+                    if resume:
+                        checkpoint.load()
+                    try:
+                        async for vacancy in each_vacancy(query.text, query.limit, prefetch_size, use_api, known_vacancies,
+                                                          engine.share(concurrency_per_query), parsing, cache,
+                                                          query.area, query.experience, seen_vacancies,
+                                                          query.first_page, query.page_step, lite, checkpoint):
+                            total += 1
+                            await vacancies.put(vacancy)
+                        log.info("Fetched %s vacancies of %s", total, query)
+                    except Exception as ex:
+                        log.error("Could not complete %s after %s vacancies cause %s",
+                                  query, total, ex)
+
+            async def crawl_all():
+                await asyncio.gather(*[crawl(query) for query in queries])
+                await vacancies.put(finished)
+
+            scheduler = asyncio.create_task(crawl_all())
+            try:
+                while True:
+                    vacancy = await vacancies.get()
+                    if vacancy is finished:
+                        break
+                    yield vacancy
+                log.info("Saved %s detail fetches of already known or seen vacancies",
+                         seen_vacancies.saved)
+            finally:
+                if not scheduler.done():
+                    scheduler.cancel()
+                    await asyncio.gather(scheduler, return_exceptions=True)
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+from queue import Empty
+from typing import List, Set
+from models.vacancy_record import VacancyRecord
+from provider.crawl_scheduler import SearchQuery, each_scheduled_vacancy
+from provider.vacancy_id_set import vacancy_id_set
+from logging_utils import logger, share_with_child_processes
+from metrics import metrics
+
+log = logger(__name__)
+
+_RECEIVE_TIMEOUT_IN_SECONDS = 1
+
+
+class CrawlWorkers:
+    """
+    Splits the crawl across worker processes, every worker runs its own event
+    loop and session. The query list is split when there are enough queries,
+    otherwise every query is split by search pages. Vacancies are sent back
+    as records and deduplicated by internal id by the coordinator, metrics
+    of a worker are merged into the coordinator once the worker is done
+    """
+
+    _workers: int
+    _queries: List[SearchQuery]
+    _prefetch_size: int
+    _use_api: bool
+    _known_vacancies: Set[int]
+    _lite: bool
+    _resume: bool
+    _queue: multiprocessing.Queue = None
+    _processes: List[multiprocessing.Process]
+    _total_duplicates: int = 0
+
+    def __init__(self, workers: int, queries: List[SearchQuery], prefetch_size: int, use_api: bool = False, known_vacancies: Set[int] = None, lite: bool = False, resume: bool = False) -> None:
+        self._workers = workers
+        self._queries = queries
+        self._prefetch_size = prefetch_size
+        self._use_api = use_api
+        self._known_vacancies = known_vacancies
+        self._lite = lite
+        self._resume = resume
+        self._processes = []
+
+    def __enter__(self):
+        share_with_child_processes()
+        self._queue = multiprocessing.Queue(maxsize=self._prefetch_size)
+        for index in range(self._workers):
+            queries = _shard(self._queries, index,
+                             self._workers, self._prefetch_size)
+            if not queries:
+                continue
+            process = multiprocessing.Process(target=_crawl, name=f"crawl-worker-{index}",
+                                              args=(queries, self._prefetch_size, self._use_api, self._known_vacancies, self._lite, self._resume, self._queue))
+            process.start()
+            self._processes.append(process)
+        log.info("Started %s crawl workers", len(self._processes))
+        return self
+
+    def __exit__(self, *args):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._queue.close()
+        self._processes = []
+
+    @property
+    def total_duplicates(self) -> int:
+        return self._total_duplicates
+
+    async def each_vacancy(self):
+        # NOTE: the configured id set keeps memory of the coordinator bounded as well
+        emitted = vacancy_id_set()
+        running = len(self._processes)
+        while running:
+            vacancy = await asyncio.to_thread(self._receive)
+            if not isinstance(vacancy, VacancyRecord):
+                if vacancy is not None:
+                    metrics.merge(*vacancy)
+                running -= 1
+                continue
+            if vacancy.internal_id in emitted:
+                self._total_duplicates += 1
+                continue
+            emitted.add(vacancy.internal_id)
+            yield vacancy
+        if self._total_duplicates:
+            log.info("Dropped %s vacancies fetched by several workers",
+                     self._total_duplicates)
+
+    def _receive(self) -> VacancyRecord:
+        while True:
+            try:
+                return self._queue.get(timeout=_RECEIVE_TIMEOUT_IN_SECONDS)
+            except Empty:
+                if not any(process.is_alive() for process in self._processes):
+                    log.error("Crawl workers exited unexpectedly")
+                    return None
+
+
+def _shard(queries: List[SearchQuery], index: int, count: int, page_size: int) -> List[SearchQuery]:
+    if len(queries) >= count:
+        return queries[index::count]
+    return [shard for shard in (query.shard(index, count, page_size) for query in queries) if shard]
+
+
+def _crawl(queries: List[SearchQuery], prefetch_size: int, use_api: bool, known_vacancies: Set[int], lite: bool, resume: bool, queue: multiprocessing.Queue):
+    # NOTE: the registry is copied by fork, metrics of the coordinator must not be sent back to it
+    metrics.reset()
+    try:
+        asyncio.run(_produce(queries, prefetch_size,
+                    use_api, known_vacancies, lite, resume, queue))
+    except Exception as ex:
+        log.error("Crawl worker failed cause %s", ex)
+    finally:
+        # NOTE: every process has its own registry, so a worker ends its crawl with a snapshot of its metrics
+        queue.put(metrics.snapshot())
+
+
+async def _produce(queries: List[SearchQuery], prefetch_size: int, use_api: bool, known_vacancies: Set[int], lite: bool, resume: bool, queue: multiprocessing.Queue):
+    # NOTE: workers are the parallelism here, so pages are parsed in place instead of a nested process pool
+    async for vacancy in each_scheduled_vacancy(queries, prefetch_size, use_api, known_vacancies, parser_workers=0, lite=lite, resume=resume):
+        await asyncio.to_thread(queue.put, vacancy)
+
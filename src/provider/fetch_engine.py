@@ -0,0 +1,88 @@
+import asyncio
+from aiohttp import ClientSession, TCPConnector, TraceConfig
+from typing import Awaitable, Callable, Iterable, List
+from config.provider import configuration
+
+
+class FetchEngine:
+    """
+    Holds a single long-lived client session with a tuned connection pool and
+    bounds the amount of simultaneously running requests
+    """
+
+    _concurrency: int
+    _connections_per_host: int
+    _keepalive_timeout: float
+    _dns_cache_ttl: int
+    _trace_configs: List[TraceConfig]
+    _session: ClientSession = None
+    _semaphore: asyncio.Semaphore = None
+
+    def __init__(self, concurrency: int = None, trace_configs: List[TraceConfig] = None) -> None:
+        self._concurrency = concurrency or configuration.property(
+            "fetch.concurrency", 10)
+        self._connections_per_host = configuration.property(
+            "fetch.connections-per-host", self._concurrency)
+        self._keepalive_timeout = configuration.property(
+            "fetch.keepalive-timeout-in-seconds", 30)
+        self._dns_cache_ttl = configuration.property(
+            "fetch.dns-cache-ttl-in-seconds", 300)
+        self._trace_configs = trace_configs or []
+
+    async def __aenter__(self):
+        connector = TCPConnector(limit=0,
+                                 limit_per_host=self._connections_per_host,
+                                 keepalive_timeout=self._keepalive_timeout,
+                                 ttl_dns_cache=self._dns_cache_ttl,
+                                 use_dns_cache=True)
+        self._session = ClientSession(
+            connector=connector, trace_configs=self._trace_configs)
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self
+
+    async def __aexit__(self, *args):
+        await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> ClientSession:
+        return self._session
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    async def run(self, f: Callable[..., Awaitable[any]], *args: any, **kwargs: any) -> any:
+        async with self._semaphore:
+            return await f(*args, **kwargs)
+
+    async def map(self, f: Callable[..., Awaitable[any]], items: Iterable[any], **kwargs: any) -> List[any]:
+        return await asyncio.gather(*[self.run(f, self._session, item, **kwargs) for item in items])
+
+    def share(self, concurrency: int) -> "FetchEngineShare":
+        return FetchEngineShare(self, concurrency)
+
+
+class FetchEngineShare:
+    """
+    Slice of a fetch engine budget, requests are bounded by the share and by
+    the engine so concurrent crawls cannot starve each other
+    """
+
+    _engine: FetchEngine
+    _semaphore: asyncio.Semaphore
+
+    def __init__(self, engine: FetchEngine, concurrency: int) -> None:
+        self._engine = engine
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    @property
+    def session(self) -> ClientSession:
+        return self._engine.session
+
+    async def run(self, f: Callable[..., Awaitable[any]], *args: any, **kwargs: any) -> any:
+        async with self._semaphore:
+            return await self._engine.run(f, *args, **kwargs)
+
+    async def map(self, f: Callable[..., Awaitable[any]], items: Iterable[any], **kwargs: any) -> List[any]:
+        return await asyncio.gather(*[self.run(f, self.session, item, **kwargs) for item in items])
@@ -1,33 +1,74 @@
-from aiohttp import ClientResponse, ClientResponseError, ClientSession, ServerTimeoutError
-import aiohttp
-from bs4 import BeautifulSoup
+from aiohttp import ClientConnectionError, ClientResponse, ClientResponseError, ClientSession, ServerTimeoutError
 from multiprocessing import Lock
 import asyncio
+import codecs
 import re
+from functools import wraps
 from json import loads
+from contextlib import nullcontext
 from typing import Callable, Coroutine, Dict, List, Set, Tuple
 from errors.parser_errors import DatasourceExternalError, NoSearchResults
-from models.vacancy import Vacancy, Skill
+from models.vacancy_record import VacancyRecord
+from provider.crawl_checkpoint import CrawlCheckpoint
+from provider.fetch_engine import FetchEngine, FetchEngineShare
+from provider.parsing_stage import ParsingStage
+from provider.parsers import InitialStateExtractor
+from provider.response_cache import CacheEntry, ResponseCache
+from provider.vacancy_id_set import VacancyIdSet, vacancy_id_set
 from logging_utils import logger
-from utils import async_retry, retry
+from metrics import metrics, timed, timer
+from utils import async_retry
 from config.provider import configuration
 
 
 class Pagination:
+    """
+    Crawl cursor, the current page is advanced only after all of its vacancies
+    were emitted, so a restarted crawl resumes from the page that failed and
+    skips vacancies it has already emitted. A sharded crawl visits every
+    step-th page starting from the current one. Vacancies are claimed in the
+    crawl-wide id set before their details are fetched, ids owned and emitted
+    by the cursor itself are only kept for the current page, so memory is
+    bounded by the id set. Every advanced page is saved to the checkpoint
+    when there is one
+    """
 
     _current_page: int = 0
     _last_page: int = 0
+    _step: int = 1
     _limit: int = 0
-    _executor: Callable[[int, int], Coroutine[any, any, List[Vacancy]]]
+    _lookahead: int = 0
+    _generated: int = 0
+    _emitted: Set[int]
+    _owned: Set[int]
+    _page_claims: Set[int]
+    _seen: VacancyIdSet
+    _checkpoint: CrawlCheckpoint = None
+    _executor: Callable[[int, int], Coroutine[any, any, List[VacancyRecord]]]
+    _pending: Dict[int, asyncio.Future]
     _lock: Lock
 
-    def __init__(self, current_page: int, max_page: int, limit: int, executor: Callable[[int, int], Coroutine[any, any, List[Vacancy]]]) -> None:
+    def __init__(self, current_page: int, max_page: int, limit: int, executor: Callable[[int, int], Coroutine[any, any, List[VacancyRecord]]], lookahead: int = 0, seen: VacancyIdSet = None, step: int = 1,
+                 generated: int = 0, checkpoint: CrawlCheckpoint = None) -> None:
         self._current_page = current_page
         self._last_page = max_page
+        self._step = step
         self._limit = limit
+        self._lookahead = lookahead
         self._executor = executor
+        self._generated = generated
+        self._checkpoint = checkpoint
+        self._emitted = set()
+        self._owned = set()
+        self._page_claims = set()
+        self._seen = seen if seen is not None else vacancy_id_set()
+        self._pending = {}
         self._lock = Lock()
 
+    @property
+    def generated(self) -> int:
+        return self._generated
+
     def done(self) -> bool:
         self._lock.acquire()
         result = self._current_page >= self._last_page
@@ -37,46 +78,165 @@ class Pagination:
     def next(self):
         if self._executor:
             self._lock.acquire()
+            self._page_claims = set()
             try:
-                result = self._executor(self._current_page, self._limit)
-                self._current_page += 1
+                result = self._pending.pop(self._current_page, None)
+                if result is None:
+                    result = self._executor(self._current_page, self._limit)
                 return result
             finally:
                 self._lock.release()
 
+    def advance(self, generated: int):
+        self._lock.acquire()
+        page, page_generated = self._current_page, generated - self._generated
+        page_emitted = list(self._emitted)
+        # NOTE: only the current page is claimed again by a retry, earlier pages are in the id set
+        self._emitted, self._owned = set(), set()
+        self._generated = generated
+        self._current_page += self._step
+        current_page, last_page = self._current_page, self._last_page
+        self._lock.release()
+        if self._checkpoint:
+            self._checkpoint.save(page, page_generated,
+                                  page_emitted, current_page, last_page)
+
+    def emit(self, vacancy_id: int):
+        self._emitted.add(vacancy_id)
+
+    def claim(self, vacancy_id: int) -> bool:
+        """
+        Claims the vacancy of the current page, false means it is a duplicate
+        on the page or was already seen by the crawl, known before it or
+        fetched by another crawl sharing the id set. Vacancies claimed by a
+        failed attempt of the page are claimed again when it is retried
+        """
+        if vacancy_id in self._page_claims:
+            self._seen.skipped()
+            return False
+        self._page_claims.add(vacancy_id)
+        if vacancy_id in self._owned and vacancy_id not in self._emitted:
+            return True
+        if vacancy_id in self._seen:
+            self._seen.skipped()
+            return False
+        self._seen.add(vacancy_id)
+        self._owned.add(vacancy_id)
+        return True
+
+    def prefetch(self, remaining: int = None):
+        """
+        Starts fetching up to lookahead pages following the current one,
+        the last known page and pages needed for remaining vacancies,
+        the current one included, cap how far it goes
+        """
+        if self._executor and self._lookahead:
+            lookahead = self._lookahead
+            if remaining is not None:
+                lookahead = min(lookahead, -(-remaining // self._limit) - 1)
+            self._lock.acquire()
+            try:
+                last_page = min(self._current_page + self._step * (1 +
+                                lookahead), self._last_page)
+                for page in range(self._current_page + self._step, last_page, self._step):
+                    if page not in self._pending:
+                        self._pending[page] = asyncio.ensure_future(
+                            self._executor(page, self._limit))
+            finally:
+                self._lock.release()
+
     def last(self, page_num: int):
         self._lock.acquire()
         self._last_page = page_num
+        for page in [p for p in self._pending.keys() if p >= page_num]:
+            self._pending.pop(page).cancel()
         self._lock.release()
 
-
-log = logger(__name__)
-
-
-async def each_vacancy(search_query: str, limit: int, prefetch_size: int, use_api: bool = False):
-    pagination = None
-    vacancies_generator = None
-    if use_api:
-        pagination = Pagination(0, 1, prefetch_size, executor=lambda current_page,
-                                prefetch_limit: _do_fetch_vacancies_using_api(search_query, prefetch_limit, current_page))
-        vacancies_generator = _each_vacancy_using_api_pagination(
-            pagination, limit)
-    else:
-        pagination = Pagination(0, 1, prefetch_size, executor=lambda current_page,
-                                prefetch_limit: _do_fetch_vacancies(search_query, prefetch_limit, current_page))
-        vacancies_generator = _each_vacancy_using_pagination(pagination, limit)
-
-    async for vacancy in vacancies_generator:
-        yield vacancy
+    def close(self):
+        self._lock.acquire()
+        for future in self._pending.values():
+            if future.done() and not future.cancelled():
+                future.exception()
+            else:
+                future.cancel()
+        self._pending.clear()
+        self._lock.release()
 
 
-async def _do_fetch_vacancies(search_query: str, limit: int = 50, page: int = 0):
-    async with aiohttp.ClientSession() as session:
-        return await _fetch_vacancies(session, search_query, limit, page)
+log = logger(__name__, rate_limited=True)
+
+_SEARCH_PAGE_CHUNK_SIZE_IN_BYTES = 64*1024
+_DETAILS_CHUNK_SIZE_IN_BYTES = 64*1024
+
+_HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+_REMOVED_VACANCY_STATUSES = (404, 410)
+
+
+async def each_vacancy(search_query: str, limit: int, prefetch_size: int, use_api: bool = False, known_vacancies: Set[int] = None,
+                       engine: FetchEngine | FetchEngineShare = None, parsing: ParsingStage = None, cache: ResponseCache = None,
+                       area: str = None, experience: str = None, seen_vacancies: VacancyIdSet = None,
+                       first_page: int = 0, page_step: int = 1, lite: bool = False, checkpoint: CrawlCheckpoint = None):
+    """
+    Yields vacancies found by search query, vacancies from known_vacancies
+    still count towards the limit but their details are not fetched.
+    A crawl opens its own fetch engine, parsing stage and response cache
+    unless already entered ones are passed. Concurrent crawls sharing
+    seen_vacancies fetch every vacancy only once, a vacancy seen by
+    another crawl counts towards the limit as well. A sharded crawl visits
+    every page_step-th search page starting from first_page. Lite api crawl
+    builds vacancies from search results without fetching their details.
+    A crawl with a loaded checkpoint resumes where it stopped, known_vacancies
+    tell which of its emitted vacancies were persisted
+    """
+    if engine is None:
+        async with FetchEngine() as engine:
+            async for vacancy in each_vacancy(search_query, limit, prefetch_size, use_api, known_vacancies, engine, parsing, cache,
+                                              area, experience, seen_vacancies, first_page, page_step, lite, checkpoint):
+                yield vacancy
+        return
+
+    if seen_vacancies is None:
+        seen_vacancies = vacancy_id_set(known_vacancies)
+    lookahead = configuration.property("vacancy-page-lookahead", 0) if configuration.has(
+        "vacancy-page-lookahead") else 2
+    current_page, last_page, generated = first_page, first_page + 1, 0
+    resume_point = checkpoint.resume_point(
+        known_vacancies or set()) if checkpoint else None
+    if resume_point:
+        current_page, generated, last_page = resume_point
+        log.info("Resuming crawl of %s from page %s after %s vacancies",
+                 search_query, current_page, generated)
+    with nullcontext(parsing) if parsing else ParsingStage() as parsing, nullcontext(cache) if cache else ResponseCache() as cache:
+        pagination = None
+        vacancies_generator = None
+        if use_api:
+            pagination = Pagination(current_page, last_page, prefetch_size, executor=lambda page,
+                                    prefetch_limit: _fetch_vacancies_using_api(engine.session, search_query, prefetch_limit, page, area, experience),
+                                    lookahead=lookahead, seen=seen_vacancies, step=page_step,
+                                    generated=generated, checkpoint=checkpoint)
+            vacancies_generator = _each_vacancy_using_api_pagination(
+                engine, cache, pagination, limit, lite)
+        else:
+            pagination = Pagination(current_page, last_page, prefetch_size, executor=lambda page,
+                                    prefetch_limit: _fetch_vacancies(engine.session, parsing, search_query, prefetch_limit, page, area, experience),
+                                    lookahead=lookahead, seen=seen_vacancies, step=page_step,
+                                    generated=generated, checkpoint=checkpoint)
+            vacancies_generator = _each_vacancy_using_pagination(
+                engine, parsing, cache, pagination, limit)
+
+        try:
+            async for vacancy in vacancies_generator:
+                yield vacancy
+            if checkpoint:
+                checkpoint.complete()
+        finally:
+            pagination.close()
 
 
-@retry(errors=[TimeoutError, NoSearchResults, ClientResponseError])
-async def _fetch_vacancies(session: ClientSession, search_query: str, limit: int = 50, page: int = 0) -> Tuple[Dict[str, any], Dict[str, any]]:
+@async_retry(errors=[TimeoutError, ClientConnectionError, NoSearchResults, ClientResponseError], endpoint="search")
+@timed("crawl_search_fetch_seconds")
+async def _fetch_vacancies(session: ClientSession, parsing: ParsingStage, search_query: str, limit: int = 50, page: int = 0, area: str = None, experience: str = None) -> Tuple[Dict[str, any], Dict[str, any]]:
     request_parameters = {
         "no_magic": True,
         "l_save_area": False,
@@ -84,12 +244,14 @@ async def _fetch_vacancies(session: ClientSession, search_query: str, limit: int
         "excluded_text": None,
         "salary": None,
         "currency_code": "RUR",
-        "experience": "doesNotMatter",
+        "experience": experience or "doesNotMatter",
         "order_by": "relevance",
         "search_period": 0,
         "items_on_page": limit,
         "disableBrowserCache": True
     }
+    if area:
+        request_parameters["area"] = area
     if page:
         request_parameters["page"] = page
 
@@ -105,138 +267,206 @@ async def _fetch_vacancies(session: ClientSession, search_query: str, limit: int
             raise DatasourceExternalError(
                 f'Could not fetch vacancies list since url is no longer valid {url}')
 
-    payload = await _parse_vacancies_from_html(response)
-    rs = payload.find_all("template", {
-        "id": re.compile(r"HH.*InitialState")
-    })
-    if rs:
-        for element in rs:
-            for content in element.contents:
-                try:
-                    vacancies_payload = loads(content)
-                    vacancies_search_result = vacancies_payload.get(
-                        "vacancySearchResult", {})
-                    pagination_definition = vacancies_search_result.get(
-                        "paging", {})
-                    return (vacancies_search_result.get("vacancies", {}), pagination_definition)
-                except Exception as ex:
-                    raise DatasourceExternalError(
-                        "Could not parse vacancies json from template tag. Maybe response format is illegal or changed", ex)
-    else:
-        raise NoSearchResults(
-            "Could not parse vacancies json from template tag cause it is missing. Maybe response format is illegal or changed")
-
-
-async def _parse_vacancies_from_html(response: ClientResponse):
-    return BeautifulSoup(await response.text(), 'html.parser')
-
-
-async def _each_vacancy_using_pagination(pagination: Pagination, limit: int):
-    total_generated = 0
-    async with aiohttp.ClientSession() as session:
-        while not pagination.done() and total_generated < limit:
-            response = await pagination.next()
-
-            vacancies_definitions, pagination_definition = response
-            last_page = pagination_definition.get(
-                "lastPage", {}).get("page", 1)
-            pagination.last(last_page)
-
-            coroutines = []
-            # TODO seems like we should keep state via Cookie header to avoid such duplicate on next page
-
-            visited_vacancies: Set[int] = set()
-            pending_vacancies: Dict[str, Tuple[any]] = {}
-            for vacancy_definition in vacancies_definitions[0:limit]:
-                vacancy_id = vacancy_definition.get("vacancyId", None)
-                type = vacancy_definition.get("type", "unknown")
-                carrier_position = vacancy_definition.get("name", None)
-                company_definition = vacancy_definition.get(
-                    "company", {})
-                company_name = company_definition.get("name", None)
-                is_company_trusted = company_definition.get(
-                    "@trusted", True)
-
-                if vacancy_id and type == 'open' and is_company_trusted:
-                    if not vacancy_id in visited_vacancies:
-                        if total_generated < limit:
-                            if company_name and carrier_position:
-                                visited_vacancies.add(vacancy_id)
-                                pending_vacancies[vacancy_id] = (
-                                    carrier_position, company_name)
-                                coroutines.append(
-                                    _fetch_vacancy_details(session, vacancy_id))
-                                total_generated += 1
-                            else:
-                                log.warn(
-                                    "Vacancies search result have an invalid shape")
-                        else:
-                            break
+    extractor = InitialStateExtractor()
+    async for chunk in response.content.iter_chunked(_SEARCH_PAGE_CHUNK_SIZE_IN_BYTES):
+        extractor.feed(chunk)
+
+    encoding = _response_encoding(response)
+    vacancies_payload = extractor.result(encoding)
+    if vacancies_payload is None:
+        log.warn(
+            "Could not find vacancies json marker on page %s, falling back to full html parsing", page)
+        vacancies_payload = await parsing.search_state(extractor.content, encoding)
+    vacancies_search_result = vacancies_payload.get(
+        "vacancySearchResult", {})
+    pagination_definition = vacancies_search_result.get(
+        "paging", {})
+    return (vacancies_search_result.get("vacancies", {}), pagination_definition)
+
+
+async def _each_vacancy_using_pagination(engine: FetchEngine | FetchEngineShare, parsing: ParsingStage, cache: ResponseCache, pagination: Pagination, limit: int):
+    total_skipped = 0
+    while not pagination.done() and pagination.generated < limit:
+        response = await pagination.next()
+        total_generated = pagination.generated
+
+        vacancies_definitions, pagination_definition = response
+        last_page = pagination_definition.get(
+            "lastPage", {}).get("page", 1)
+        pagination.last(last_page)
+        pagination.prefetch(limit - total_generated)
+
+        # TODO seems like we should keep state via Cookie header to avoid such duplicate on next page
+
+        pending_vacancies: Dict[str, Tuple[any]] = {}
+        for vacancy_definition in vacancies_definitions[0:limit]:
+            vacancy_id = vacancy_definition.get("vacancyId", None)
+            type = vacancy_definition.get("type", "unknown")
+            carrier_position = vacancy_definition.get("name", None)
+            company_definition = vacancy_definition.get(
+                "company", {})
+            company_name = company_definition.get("name", None)
+            is_company_trusted = company_definition.get(
+                "@trusted", True)
+
+            if vacancy_id and type == 'open' and is_company_trusted:
+                if total_generated < limit:
+                    if company_name and carrier_position:
+                        total_generated += 1
+                        if not pagination.claim(_internal_id(vacancy_id)):
+                            total_skipped += 1
+                            continue
+                        pending_vacancies[vacancy_id] = (
+                            carrier_position, company_name)
                     else:
                         log.warn(
-                            "Vacancy %s data is already gathered", vacancy_id)
+                            "Vacancies search result have an invalid shape")
                 else:
-                    log.warn("Vacancy %s from %s is ignored since it is in archive or company is untrusted",
-                             carrier_position, company_name)
-
-            vacancy_details_responses = await asyncio.gather(*coroutines)
-
-            create_task_coroutines = []
-            for id, vacancy_details_response in vacancy_details_responses:
-                if id in pending_vacancies:
-                    carrier_position, company_name = pending_vacancies.get(id)
-                    create_task_coroutines.append(_create_vacancy_from_html(
-                        id, carrier_position, company_name, vacancy_details_response))
-
-            vacancies = await asyncio.gather(*create_task_coroutines)
-            for vacancy in vacancies:
-                yield vacancy
-
-
-@async_retry(errors=[TimeoutError, ClientResponseError])
-async def _fetch_vacancy_details(session: ClientSession, vacancy_id: int):
+                    break
+            else:
+                log.warn("Vacancy %s from %s is ignored since it is in archive or company is untrusted",
+                         carrier_position, company_name)
+
+        vacancy_details_responses = await engine.map(_skipping_failures(_fetch_vacancy_details), pending_vacancies.keys(), cache=cache)
+
+        create_task_coroutines = []
+        for response in vacancy_details_responses:
+            id, entry = response or (None, None)
+            if entry is None:
+                total_generated -= 1
+            elif id in pending_vacancies:
+                carrier_position, company_name = pending_vacancies.get(id)
+                create_task_coroutines.append(_create_vacancy_from_html(
+                    parsing, cache, id, carrier_position, company_name, entry))
+
+        vacancies = await asyncio.gather(*create_task_coroutines)
+        for vacancy in vacancies:
+            pagination.emit(vacancy.internal_id)
+            yield vacancy
+
+        pagination.advance(total_generated)
+
+    if total_skipped:
+        log.info("Skipped details of %s already known or seen vacancies", total_skipped)
+
+
+def _skipping_failures(f: Callable):
+    """
+    Wraps a vacancy fetch, a vacancy which still fails after its retries,
+    e.g. removed between search and fetch, is skipped instead of failing the page
+    """
+    @wraps(f)
+    async def _enclosed_function(session: ClientSession, vacancy: any, **kwargs: any) -> any:
+        try:
+            return await f(session, vacancy, **kwargs)
+        except (TimeoutError, ClientConnectionError, ClientResponseError) as ex:
+            metrics.increment("crawl_failed_vacancies_total")
+            log.warn("Vacancy is skipped since it could not be fetched cause %s", ex)
+            return None
+    return _enclosed_function
+
+
+@async_retry(errors=[TimeoutError, ClientConnectionError, ClientResponseError], endpoint="detail")
+async def _fetch_vacancy_details(session: ClientSession, vacancy_id: int, cache: ResponseCache):
     url = f'{configuration.property("hh-vacancy-details-endpoint")}{vacancy_id}'
-    response = await session.get(url, headers=_with_hh_headers(), timeout=configuration.property("request-timeout-in-seconds", 15))
+    return (vacancy_id, await _fetch_details_entry(session, cache, url))
+
+
+@timed("crawl_detail_fetch_seconds")
+async def _fetch_details_entry(session: ClientSession, cache: ResponseCache, url: str, truncate: bool = True) -> CacheEntry:
+    """
+    Fetches details page using conditional request when the page is cached,
+    the cached entry is returned as is if the page was not modified.
+    None is returned when the page is rejected as oversized
+    """
+    previous = await cache.lookup(url)
+    headers = _with_hh_headers()
+    if previous:
+        headers.update(previous.conditional_headers())
+
+    response = await session.get(url, headers=headers, timeout=configuration.property("request-timeout-in-seconds", 15))
+    if previous and response.status == 304:
+        response.release()
+        return previous
+
     response.raise_for_status()
-    return (vacancy_id, response)
-
-
-@async_retry(errors=[TimeoutError, ClientResponseError])
-async def _create_vacancy_from_html(id: int, carrier_position: str, company_name: str, response: ClientResponse) -> Vacancy:
-    vacancy_details = BeautifulSoup(await response.text(), "html.parser")
-    skill_elements = vacancy_details.find_all("span", attrs={
-        "data-qa": "bloko-tag__text"
-    })
-
-    skills: List[Skill] = []
-
-    if skill_elements:
-        for skill_element in skill_elements:
-            skills.append(Skill(name=str(skill_element.text).lower()))
-
-    vacancy_description = ""
-    description = vacancy_details.find_all("div", attrs={
-        "data-qa": "vacancy-description"
-    })
-
-    if description:
-        for description_part in description:
-            text_lines = [v if isinstance(v, str) else str(
-                v.text) for v in description_part.contents]
-            vacancy_description = "\n".join(
-                [vacancy_description]+[v.strip("\n").strip() for v in text_lines])
-
-    vacancy: Vacancy = Vacancy(
-        company=company_name,
-        description=vacancy_description.strip("\n"),
-        carrier_position=carrier_position,
-        skills=skills,
-        internal_id=id
-    )
+    body = await _read_bounded(response, truncate)
+    if body is None:
+        return None
+    return cache.entry(url, body, _response_encoding(response), response.headers, previous)
+
+
+async def _read_bounded(response: ClientResponse, truncate: bool = True) -> bytes:
+    """
+    Reads the body as soon as headers arrive into a buffer bounded by
+    fetch.max-response-size-in-bytes, so the connection goes back to the pool
+    before the page is parsed. An oversized body is truncated when allowed by
+    both the caller and fetch.oversized-response-policy, otherwise None is returned
+    """
+    max_size = configuration.property(
+        "fetch.max-response-size-in-bytes", 4*1024*1024)
+    truncate = truncate and configuration.property(
+        "fetch.oversized-response-policy", "truncate") == "truncate"
+    oversized = response.content_length is not None and response.content_length > max_size
+    body = bytearray()
+    if not oversized or truncate:
+        async for chunk in response.content.iter_chunked(_DETAILS_CHUNK_SIZE_IN_BYTES):
+            body += chunk
+            if len(body) > max_size:
+                oversized = True
+                break
+    if not oversized:
+        response.release()
+        return bytes(body)
+
+    # NOTE: the rest of the body is left unread, so the connection is closed instead of being reused
+    response.close()
+    metrics.increment("crawl_oversized_responses_total")
+    log.warn("Response of %s exceeds %s bytes and is %s", response.url, max_size,
+             "truncated" if truncate else "rejected")
+    return _trim_to_character(bytes(body[:max_size]), _response_encoding(response)) if truncate else None
+
+
+def _trim_to_character(body: bytes, encoding: str) -> bytes:
+    """
+    Drops the trailing bytes of a multibyte character cut by truncation,
+    so the truncated body still decodes
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        decoder.decode(body, final=False)
+        pending, _ = decoder.getstate()
+    except (LookupError, UnicodeDecodeError):
+        return body
+    return body[:len(body) - len(pending)]
+
+
+async def _create_vacancy_from_html(parsing: ParsingStage, cache: ResponseCache, id: int, carrier_position: str, company_name: str, entry: CacheEntry) -> VacancyRecord:
+    vacancy_details = entry.details
+    if vacancy_details is None:
+        vacancy_details = entry.details = await parsing.vacancy_details(await cache.body(entry), entry.encoding)
+    await cache.store(entry)
+
+    with timer("crawl_vacancy_build_seconds"):
+        vacancy = VacancyRecord(
+            company=company_name,
+            description=vacancy_details.get("description", ""),
+            carrier_position=carrier_position,
+            skills=tuple(vacancy_details.get("skills", [])),
+            internal_id=id
+        )
     log.info("Discovered vacancy %s", vacancy)
     return vacancy
 
 
+def _response_encoding(response: ClientResponse) -> str:
+    """
+    Encoding of a streamed body, aiohttp can not guess it once the body was
+    read by chunks, so a response without charset is decoded as utf-8
+    """
+    return response.charset or "utf-8"
+
+
 def _with_hh_headers():
     return {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36 Edg/114.0.1823.82",
@@ -251,17 +481,17 @@ def _with_hh_headers():
     }
 
 
-async def _do_fetch_vacancies_using_api(search_query: str, limit: int = 50, page: int = 0):
-    async with aiohttp.ClientSession() as session:
-        return await _fetch_vacancies_using_api(session, search_query, limit, page)
-
-
-@async_retry(errors=[TimeoutError, ClientResponseError])
-async def _fetch_vacancies_using_api(session: ClientSession, search_query: str, limit: int = 50, page: int = 0):
+@async_retry(errors=[TimeoutError, ClientConnectionError, ClientResponseError], endpoint="api")
+@timed("crawl_search_fetch_seconds")
+async def _fetch_vacancies_using_api(session: ClientSession, search_query: str, limit: int = 50, page: int = 0, area: str = None, experience: str = None):
     request_parameters = {
         "per_page": limit,
         "text": search_query
     }
+    if area:
+        request_parameters["area"] = area
+    if experience:
+        request_parameters["experience"] = experience
     if page:
         request_parameters["page"] = page
     url = f'{configuration.property("hh-api-endpoint")}?{"&".join( "=".join([k, "" if v is None else str(v)]) for k,v in request_parameters.items())}'
@@ -270,39 +500,53 @@ async def _fetch_vacancies_using_api(session: ClientSession, search_query: str,
     return await response.json()
 
 
-@retry(errors=[TimeoutError, NoSearchResults])
-async def _each_vacancy_using_api_pagination(pagination: Pagination, limit: int):
-    total_generated = 0
-    async with aiohttp.ClientSession() as session:
-        while not pagination.done() and total_generated < limit:
-            payload = await pagination.next()
+async def _each_vacancy_using_api_pagination(engine: FetchEngine | FetchEngineShare, cache: ResponseCache, pagination: Pagination, limit: int, lite: bool = False):
+    total_skipped = 0
+    while not pagination.done() and pagination.generated < limit:
+        payload = await pagination.next()
+        total_generated = pagination.generated
+
+        if not payload.get("found", 0):
+            # NOTE: nothing found is a valid result of the query, so it is not retried
+            log.info("There is no vacancies found by the search query")
+            break
+
+        last_page = payload.get("pages", 1)
+        pagination.last(last_page)
+        pagination.prefetch(limit - total_generated)
+
+        vacancy_definitions = []
+        for vacancy_definition in payload.get("items", [])[0:limit]:
+            if total_generated < limit:
+                total_generated += 1
+                if not pagination.claim(_internal_id(vacancy_definition.get("id", None))):
+                    total_skipped += 1
+                    continue
+                vacancy_definitions.append(vacancy_definition)
+            else:
+                break
+
+        if lite:
+            vacancies = [_create_lite_vacancy(vacancy_definition)
+                         for vacancy_definition in vacancy_definitions]
+        else:
+            vacancies = await engine.map(_skipping_failures(_fetch_and_create_vacancy_using_api), vacancy_definitions, cache=cache)
+        for vacancy in vacancies:
+            if vacancy:
+                pagination.emit(vacancy.internal_id)
+                yield vacancy
+            else:
+                total_generated -= 1
 
-            if not payload.get("found", 0):
-                raise NoSearchResults("There is no vacancies")
+        pagination.advance(total_generated)
 
-            last_page = payload.get("pages", 1)
-            pagination.last(last_page)
+    if total_skipped:
+        log.info("Skipped details of %s already known or seen vacancies", total_skipped)
 
-            coroutines = []
-            for vacancy_definition in payload.get("items", [])[0:limit]:
-                if total_generated < limit:
-                    coroutines.append(_fetch_and_create_vacancy_using_api(
-                        session, vacancy_definition))
-                    total_generated += 1
-                else:
-                    break
-
-            vacancies = await asyncio.gather(*coroutines)
-            for vacancy in vacancies:
-                if vacancy:
-                    yield vacancy
-                else:
-                    total_generated -= 1
 
-
-@async_retry(errors=[TimeoutError, ClientResponseError])
-async def _fetch_and_create_vacancy_using_api(session: ClientSession, vacancy_definition: Dict[str, any]):
-    vacancy_id = vacancy_definition.get("id", None)
+@async_retry(errors=[TimeoutError, ClientConnectionError, ClientResponseError], endpoint="api")
+async def _fetch_and_create_vacancy_using_api(session: ClientSession, vacancy_definition: Dict[str, any], cache: ResponseCache):
+    vacancy_id = _internal_id(vacancy_definition.get("id", None))
     vacancy_url = vacancy_definition.get("url", None)
     carrier_position = vacancy_definition.get("name", None)
     company_name = vacancy_definition.get("employer", {}).get("name", None)
@@ -310,22 +554,99 @@ async def _fetch_and_create_vacancy_using_api(session: ClientSession, vacancy_de
         "employer", {}).get("trusted", False)
 
     if vacancy_url and is_company_trusted:
-        response = await session.get(vacancy_url, headers=_with_hh_headers(), timeout=configuration.property("request-timeout-in-seconds", 15))
-        response.raise_for_status()
-        payload = await response.json()
+        # NOTE: truncated json can not be parsed, so oversized api responses are always rejected
+        entry = await _fetch_details_entry(session, cache, vacancy_url, truncate=False)
+        if entry is None:
+            return None
+        vacancy_details = entry.details
+        if vacancy_details is None:
+            body = await cache.body(entry)
+            with timer("crawl_parse_seconds"):
+                payload = loads(body.decode(entry.encoding))
+                vacancy_details = entry.details = {
+                    "skills": [s.get("name").lower() for s in filter(
+                        lambda s: True if s.get("name", False) else False, payload.get("key_skills", []))],
+                    "description": payload.get("description", "").strip("\n").strip()
+                }
+        await cache.store(entry)
 
         if company_name and carrier_position:
-            skills = [Skill(name=s.get("name").lower()) for s in filter(
-                lambda s: True if s.get("name", False) else False, payload.get("key_skills", []))]
-            vacancy: Vacancy = Vacancy(
+            with timer("crawl_vacancy_build_seconds"):
+                vacancy = VacancyRecord(
+                    company=company_name,
+                    description=vacancy_details.get("description", ""),
+                    carrier_position=carrier_position,
+                    skills=tuple(vacancy_details.get("skills", [])),
+                    internal_id=vacancy_id
+                )
+            log.info("Discovered vacancy %s", vacancy)
+            return vacancy
+    else:
+        log.warn("Vacancy %s from %s is ignored since it is in archive or company is untrusted",
+                 carrier_position, company_name)
+
+
+def _create_lite_vacancy(vacancy_definition: Dict[str, any]) -> VacancyRecord:
+    carrier_position = vacancy_definition.get("name", None)
+    company_name = vacancy_definition.get("employer", {}).get("name", None)
+    is_company_trusted = vacancy_definition.get(
+        "employer", {}).get("trusted", False)
+
+    if is_company_trusted and company_name and carrier_position:
+        snippet = vacancy_definition.get("snippet", None) or {}
+        with timer("crawl_vacancy_build_seconds"):
+            vacancy = VacancyRecord(
                 company=company_name,
-                description=payload.get("description", "").strip("\n").strip(),
+                description="\n".join(_HTML_TAG_PATTERN.sub("", snippet.get(name)) for name in [
+                    "requirement", "responsibility"] if snippet.get(name)),
                 carrier_position=carrier_position,
-                skills=skills,
-                internal_id=vacancy_id
+                internal_id=_internal_id(vacancy_definition.get("id", None)),
+                enriched=False
             )
-            log.info("Discovered vacancy %s", vacancy)
-            return vacancy
+        log.info("Discovered lite vacancy %s", vacancy)
+        return vacancy
     else:
         log.warn("Vacancy %s from %s is ignored since it is in archive or company is untrusted",
                  carrier_position, company_name)
+
+
+async def each_enriched_vacancy(vacancies: List[VacancyRecord], batch_size: int, engine: FetchEngine = None, removed: List[int] = None):
+    """
+    Fetches skills and full description of lite vacancies using api,
+    vacancies are yielded as enriched copies. A vacancy which could not be
+    fetched is skipped, ids of vacancies removed from hh are added to removed
+    """
+    if engine is None:
+        async with FetchEngine() as engine:
+            async for vacancy in each_enriched_vacancy(vacancies, batch_size, engine, removed):
+                yield vacancy
+        return
+
+    async def _enrich(session: ClientSession, vacancy_definition: Dict[str, any], cache: ResponseCache) -> VacancyRecord:
+        try:
+            return await _fetch_and_create_vacancy_using_api(session, vacancy_definition, cache=cache)
+        except ClientResponseError as ex:
+            if ex.status not in _REMOVED_VACANCY_STATUSES:
+                raise
+            log.warn("Vacancy %s is removed from hh", vacancy_definition.get("id"))
+            if removed is not None:
+                removed.append(vacancy_definition.get("id"))
+
+    with ResponseCache() as cache:
+        for offset in range(0, len(vacancies), batch_size):
+            vacancy_definitions = [{
+                "id": vacancy.internal_id,
+                "url": f'{configuration.property("hh-api-endpoint")}/{vacancy.internal_id}',
+                "name": vacancy.carrier_position,
+                "employer": {"name": vacancy.company, "trusted": True}
+            } for vacancy in vacancies[offset:offset + batch_size]]
+            for vacancy in await engine.map(_skipping_failures(_enrich), vacancy_definitions, cache=cache):
+                if vacancy:
+                    yield vacancy
+
+
+def _internal_id(value: any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,216 @@
+import re
+from abc import ABC, abstractmethod
+from html import unescape
+from json import loads
+from typing import Dict, List, Tuple, Type
+from bs4 import BeautifulSoup
+from errors.parser_errors import DatasourceExternalError, NoSearchResults
+
+# NOTE: functions below are executed inside parser worker processes, so they
+# accept raw bytes, return plain data and must not depend on the configuration
+
+_INITIAL_STATE_TEMPLATE_PATTERN = re.compile(
+    rb'<template[^>]*\sid=["\']HH[^"\']*InitialState["\'][^>]*>', re.IGNORECASE)
+_TEMPLATE_END_PATTERN = re.compile(rb"</template", re.IGNORECASE)
+_MARKER_OVERLAP_IN_BYTES = 256
+
+
+class InitialStateExtractor:
+    """
+    Scans a search page chunk by chunk for the HH InitialState template and
+    keeps only its body once the opening tag is found, no DOM is built.
+    Until then the content is buffered so the caller can fall back to a full parse
+    """
+
+    _buffer: bytearray
+    _scan_offset: int = 0
+    _found: bool = False
+    _done: bool = False
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> bool:
+        if self._done:
+            return True
+
+        self._buffer.extend(chunk)
+        if not self._found:
+            match = _INITIAL_STATE_TEMPLATE_PATTERN.search(
+                self._buffer, self._scan_offset)
+            if not match:
+                self._scan_offset = max(
+                    0, len(self._buffer) - _MARKER_OVERLAP_IN_BYTES)
+                return False
+            del self._buffer[:match.end()]
+            self._scan_offset = 0
+            self._found = True
+
+        match = _TEMPLATE_END_PATTERN.search(self._buffer, self._scan_offset)
+        if match:
+            del self._buffer[match.start():]
+            self._done = True
+        else:
+            self._scan_offset = max(
+                0, len(self._buffer) - len(_TEMPLATE_END_PATTERN.pattern))
+        return self._done
+
+    @property
+    def content(self) -> bytes:
+        return bytes(self._buffer)
+
+    def result(self, encoding: str = "utf-8") -> Dict[str, any]:
+        if not self._done:
+            return None
+        try:
+            return loads(unescape(self._buffer.decode(encoding)))
+        except Exception as ex:
+            raise DatasourceExternalError(
+                "Could not parse vacancies json from template tag. Maybe response format is illegal or changed", ex)
+
+
+def parse_search_state(content: bytes, encoding: str = "utf-8") -> Dict[str, any]:
+    document = BeautifulSoup(content.decode(encoding), "html.parser")
+    rs = document.find_all("template", {
+        "id": re.compile(r"HH.*InitialState")
+    })
+    if rs:
+        for element in rs:
+            for template_content in element.contents:
+                try:
+                    return loads(template_content)
+                except Exception as ex:
+                    raise DatasourceExternalError(
+                        "Could not parse vacancies json from template tag. Maybe response format is illegal or changed", ex)
+    raise NoSearchResults(
+        "Could not parse vacancies json from template tag cause it is missing. Maybe response format is illegal or changed")
+
+
+class VacancyDetailsParser(ABC):
+    """
+    Extracts skills and description text nodes from a vacancy details page,
+    backends produce the same output for well-formed pages, malformed markup
+    may be repaired differently, use bench.parser_parity to compare them
+    """
+
+    def parse(self, content: bytes, encoding: str = "utf-8") -> Dict[str, any]:
+        skills, description_parts = self._extract(content, encoding)
+
+        vacancy_description = ""
+        for text_lines in description_parts:
+            vacancy_description = "\n".join(
+                [vacancy_description]+[v.strip("\n").strip() for v in text_lines])
+
+        return {
+            "skills": [skill.lower() for skill in skills],
+            "description": vacancy_description.strip("\n")
+        }
+
+    @abstractmethod
+    def _extract(self, content: bytes, encoding: str) -> Tuple[List[str], List[List[str]]]:
+        pass
+
+
+class BeautifulSoupDetailsParser(VacancyDetailsParser):
+
+    def _extract(self, content: bytes, encoding: str) -> Tuple[List[str], List[List[str]]]:
+        vacancy_details = BeautifulSoup(content.decode(encoding), "html.parser")
+        skill_elements = vacancy_details.find_all("span", attrs={
+            "data-qa": "bloko-tag__text"
+        })
+        skills = [str(skill_element.text) for skill_element in skill_elements]
+
+        description = vacancy_details.find_all("div", attrs={
+            "data-qa": "vacancy-description"
+        })
+        description_parts = [[v if isinstance(v, str) else str(v.text) for v in description_part.contents]
+                             for description_part in description]
+        return (skills, description_parts)
+
+
+class LxmlDetailsParser(VacancyDetailsParser):
+    """
+    Follows what BeautifulSoup with html.parser yields on well-formed markup:
+    whitespace only strings collapse to a single newline or space outside of
+    pre and textarea, nested comments, scripts, styles and templates do not
+    contribute to the text. Unclosed elements are repaired by libxml2 instead,
+    e.g. implicitly closed paragraphs become separate lines
+    """
+
+    _WHITESPACE_PRESERVING_TAGS = frozenset(["pre", "textarea"])
+    _NON_TEXT_TAGS = frozenset(["script", "style", "template", "rt", "rp"])
+    _ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+    def __init__(self) -> None:
+        # NOTE: lxml is optional, so it is imported only when the backend is selected
+        from lxml import etree, html
+        self._etree = etree
+        self._html = html
+
+    def _extract(self, content: bytes, encoding: str) -> Tuple[List[str], List[List[str]]]:
+        if not content.strip():
+            return ([], [])
+
+        vacancy_details = self._html.fromstring(
+            content, parser=self._html.HTMLParser(encoding=encoding))
+        skills = [self._text(skill_element, top=True) for skill_element in vacancy_details.iterfind(
+            ".//span[@data-qa='bloko-tag__text']")]
+
+        description_parts = []
+        for description_part in vacancy_details.iterfind(".//div[@data-qa='vacancy-description']"):
+            preserve = self._preserves_whitespace(description_part)
+            text_lines = [self._string(description_part.text, preserve)] if description_part.text else []
+            for element in description_part:
+                if self._is_markup(element):
+                    text_lines.append(element.text or "")
+                else:
+                    text_lines.append(self._text(element, preserve, top=True))
+                if element.tail:
+                    text_lines.append(self._string(element.tail, preserve))
+            description_parts.append(text_lines)
+        return (skills, description_parts)
+
+    def _text(self, element, preserve: bool = False, top: bool = False) -> str:
+        if self._is_markup(element) or (not top and element.tag in self._NON_TEXT_TAGS):
+            return ""
+
+        preserve = preserve or element.tag in self._WHITESPACE_PRESERVING_TAGS
+        parts = [self._string(element.text, preserve)] if element.text else []
+        for child in element:
+            parts.append(self._text(child, preserve))
+            if child.tail:
+                parts.append(self._string(child.tail, preserve))
+        return "".join(parts)
+
+    def _string(self, value: str, preserve: bool) -> str:
+        if preserve or value.strip(self._ASCII_SPACES):
+            return value
+        return "\n" if "\n" in value else " "
+
+    def _preserves_whitespace(self, element) -> bool:
+        return any(e.tag in self._WHITESPACE_PRESERVING_TAGS for e in element.iterancestors())
+
+    def _is_markup(self, element) -> bool:
+        return isinstance(element, (self._etree._Comment, self._etree._ProcessingInstruction, self._etree._Entity))
+
+
+_DETAILS_PARSER_BACKENDS: Dict[str, Type[VacancyDetailsParser]] = {
+    "html.parser": BeautifulSoupDetailsParser,
+    "lxml": LxmlDetailsParser
+}
+_details_parsers: Dict[str, VacancyDetailsParser] = {}
+
+
+def details_parser(backend: str = "html.parser") -> VacancyDetailsParser:
+    parser = _details_parsers.get(backend, None)
+    if not parser:
+        parser_type = _DETAILS_PARSER_BACKENDS.get(backend, None)
+        if not parser_type:
+            raise ValueError(
+                f"Unknown parser backend {backend}, expected one of {', '.join(_DETAILS_PARSER_BACKENDS.keys())}")
+        parser = _details_parsers[backend] = parser_type()
+    return parser
+
+
+def parse_vacancy_details(content: bytes, encoding: str = "utf-8", backend: str = "html.parser") -> Dict[str, any]:
+    return details_parser(backend).parse(content, encoding)
@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict
+from provider.parsers import details_parser, parse_search_state, parse_vacancy_details
+from metrics import timed
+from config.provider import configuration
+
+
+class ParsingStage:
+    """
+    Runs html parsing in a pool of worker processes so the event loop keeps
+    serving network io, zero workers means parsing happens in place
+    """
+
+    _workers: int
+    _backend: str
+    _executor: ProcessPoolExecutor = None
+
+    def __init__(self, workers: int = None, backend: str = None) -> None:
+        if workers is None:
+            # NOTE: zero is a valid amount of workers, so it must not fall back to the default
+            workers = configuration.property(
+                "parser-workers", 0) if configuration.has("parser-workers") else 2
+        self._workers = workers
+        self._backend = backend or configuration.property(
+            "parser-backend", "html.parser")
+        # NOTE: fail fast on unknown or not installed backend instead of inside workers
+        details_parser(self._backend)
+
+    def __enter__(self):
+        if self._workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        return self
+
+    def __exit__(self, *args):
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def search_state(self, content: bytes, encoding: str) -> Dict[str, any]:
+        return await self._run(parse_search_state, content, encoding)
+
+    async def vacancy_details(self, content: bytes, encoding: str) -> Dict[str, any]:
+        return await self._run(parse_vacancy_details, content, encoding, self._backend)
+
+    @timed("crawl_parse_seconds")
+    async def _run(self, f: Callable, *args: any) -> any:
+        if self._executor:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, f, *args)
+        return f(*args)
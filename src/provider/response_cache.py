@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sqlite3
+from hashlib import sha1, sha256
+from json import dumps, loads
+from threading import Lock
+from time import time
+from typing import Dict
+from logging_utils import logger
+from config.provider import configuration
+
+log = logger(__name__)
+
+
+class CacheEntry:
+
+    url: str
+    body: bytes
+    encoding: str
+    etag: str
+    last_modified: str
+    digest: str
+    details: Dict[str, any]
+
+    def __init__(self, url: str, body: bytes, encoding: str, etag: str = None, last_modified: str = None, digest: str = None, details: Dict[str, any] = None) -> None:
+        self.url = url
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest or (sha256(body).hexdigest()
+                                 if body is not None else None)
+        self.details = details
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    On-disk cache of detail responses keyed by url. Bodies are kept as files and
+    an sqlite index holds validators, content hash and parsed details, least
+    recently used entries are evicted once the total size exceeds the limit
+    """
+
+    _enabled: bool
+    _path: str
+    _max_size_in_bytes: int
+    _total_size_in_bytes: int = 0
+    _index: sqlite3.Connection = None
+    _lock: Lock
+
+    def __init__(self, enabled: bool = None, path: str = None, max_size_in_bytes: int = None) -> None:
+        self._enabled = configuration.property(
+            "response-cache.enabled", False) if enabled is None else enabled
+        self._path = path or configuration.property(
+            "response-cache.path", "./.cache/responses")
+        self._max_size_in_bytes = max_size_in_bytes or configuration.property(
+            "response-cache.max-size-in-bytes", 256*1024*1024)
+        self._lock = Lock()
+
+    def __enter__(self):
+        if self._enabled:
+            os.makedirs(self._path, exist_ok=True)
+            self._index = sqlite3.connect(os.path.join(
+                self._path, "index.db"), check_same_thread=False)
+            self._index.execute("CREATE TABLE IF NOT EXISTS entry (url TEXT PRIMARY KEY, file TEXT, size INTEGER, encoding TEXT, "
+                                "etag TEXT, last_modified TEXT, digest TEXT, details TEXT, accessed_at REAL)")
+            self._index.execute(
+                "CREATE INDEX IF NOT EXISTS entry_accessed_at ON entry (accessed_at)")
+            self._total_size_in_bytes = self._index.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entry").fetchone()[0]
+        return self
+
+    def __exit__(self, *args):
+        if self._index:
+            self._index.commit()
+            self._index.close()
+            self._index = None
+
+    def entry(self, url: str, body: bytes, encoding: str, headers: Dict[str, str], previous: CacheEntry = None) -> CacheEntry:
+        """
+        Creates an entry for a fresh response, parsed details of the previous
+        entry are reused when the content has not changed
+        """
+        entry = CacheEntry(url, body, encoding, headers.get(
+            "ETag", None), headers.get("Last-Modified", None))
+        if previous and previous.digest == entry.digest:
+            entry.details = previous.details
+        return entry
+
+    async def lookup(self, url: str) -> CacheEntry:
+        if not self._enabled:
+            return None
+        return await asyncio.to_thread(self._lookup, url)
+
+    async def body(self, entry: CacheEntry) -> bytes:
+        if entry.body is None and self._enabled:
+            entry.body = await asyncio.to_thread(self._read_body, entry.url)
+        return entry.body
+
+    async def store(self, entry: CacheEntry):
+        if self._enabled:
+            await asyncio.to_thread(self._store, entry)
+
+    def _lookup(self, url: str) -> CacheEntry:
+        with self._lock:
+            row = self._index.execute(
+                "SELECT encoding, etag, last_modified, digest, details FROM entry WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        encoding, etag, last_modified, digest, details = row
+        return CacheEntry(url, None, encoding, etag, last_modified, digest, loads(details) if details else None)
+
+    def _read_body(self, url: str) -> bytes:
+        try:
+            with open(self._file(url), "rb") as stream:
+                return stream.read()
+        except OSError:
+            return None
+
+    def _store(self, entry: CacheEntry):
+        file = self._file(entry.url)
+        with self._lock:
+            row = self._index.execute(
+                "SELECT size, digest FROM entry WHERE url = ?", (entry.url,)).fetchone()
+            size, digest = row if row else (0, None)
+            if entry.body is not None and digest != entry.digest:
+                os.makedirs(os.path.dirname(file), exist_ok=True)
+                with open(file, "wb") as stream:
+                    stream.write(entry.body)
+                self._total_size_in_bytes += len(entry.body) - size
+                size = len(entry.body)
+            self._index.execute("INSERT OR REPLACE INTO entry (url, file, size, encoding, etag, last_modified, digest, details, accessed_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (entry.url, file, size, entry.encoding, entry.etag, entry.last_modified, entry.digest,
+                                 dumps(entry.details) if entry.details is not None else None, time()))
+            self._evict()
+            self._index.commit()
+
+    def _evict(self):
+        evicted = 0
+        while self._total_size_in_bytes > self._max_size_in_bytes:
+            rows = self._index.execute(
+                "SELECT url, file, size FROM entry ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, file, size in rows:
+                if self._total_size_in_bytes <= self._max_size_in_bytes:
+                    break
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+                self._index.execute("DELETE FROM entry WHERE url = ?", (url,))
+                self._total_size_in_bytes -= size
+                evicted += 1
+        if evicted:
+            log.debug("Evicted %s cached responses", evicted)
+
+    def _file(self, url: str) -> str:
+        name = sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self._path, name[0:2], name)
@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from math import ceil, log as ln
+from typing import Iterable, Set
+from config.provider import configuration
+
+_MASK_64 = (1 << 64) - 1
+
+
+class VacancyIdSet(ABC):
+    """
+    Crawl-wide membership of vacancy ids consulted before details are fetched,
+    counts fetches it saved
+    """
+
+    _saved: int = 0
+
+    @property
+    def saved(self) -> int:
+        return self._saved
+
+    def skipped(self):
+        self._saved += 1
+
+    @abstractmethod
+    def add(self, vacancy_id: int):
+        pass
+
+    def update(self, vacancy_ids: Iterable[int]):
+        for vacancy_id in vacancy_ids:
+            self.add(vacancy_id)
+
+    @abstractmethod
+    def __contains__(self, vacancy_id: int) -> bool:
+        pass
+
+
+class CompactIdSet(VacancyIdSet):
+    """
+    Exact set kept as a sorted array of 64-bit integers, recent ids are
+    buffered in a regular set and merged into the array in bulk
+    """
+
+    _ids: array
+    _recent: Set[int]
+    _merge_size: int
+
+    def __init__(self, merge_size: int = 64*1024) -> None:
+        self._ids = array("q")
+        self._recent = set()
+        self._merge_size = merge_size
+
+    def add(self, vacancy_id: int):
+        if vacancy_id not in self:
+            self._recent.add(vacancy_id)
+            if len(self._recent) >= self._merge_size:
+                self._ids = array("q", sorted(
+                    [*self._ids, *self._recent]))
+                self._recent = set()
+
+    def __contains__(self, vacancy_id: int) -> bool:
+        if vacancy_id in self._recent:
+            return True
+        index = bisect_left(self._ids, vacancy_id)
+        return index < len(self._ids) and self._ids[index] == vacancy_id
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._recent)
+
+
+class BloomIdSet(VacancyIdSet):
+    """
+    Bloom filter for very large crawls, a false positive skips a vacancy
+    with the configured probability but memory does not grow with the crawl
+    """
+
+    _bits: bytearray
+    _size: int
+    _hashes: int
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self._size = max(8, ceil(-capacity * ln(error_rate) / ln(2) ** 2))
+        self._hashes = max(1, round(self._size / capacity * ln(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def add(self, vacancy_id: int):
+        for position in self._positions(vacancy_id):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, vacancy_id: int) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(vacancy_id))
+
+    def _positions(self, vacancy_id: int) -> Iterable[int]:
+        # NOTE: double hashing over two halves of a splitmix64 mix of the id
+        value = (vacancy_id + 0x9E3779B97F4A7C15) & _MASK_64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+        value ^= value >> 31
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        return ((first + i * second) % self._size for i in range(self._hashes))
+
+
+def vacancy_id_set(seed: Iterable[int] = None) -> VacancyIdSet:
+    """
+    Creates the id set configured by dedup.kind, set or bloom
+    """
+    kind = configuration.property("dedup.kind", "set")
+    if kind == "bloom":
+        ids = BloomIdSet(configuration.property("dedup.capacity", 1000000),
+                         configuration.property("dedup.error-rate", 0.001))
+    elif kind == "set":
+        ids = CompactIdSet()
+    else:
+        raise ValueError(f"Unknown vacancy id set kind {kind}")
+    if seed:
+        ids.update(seed)
+    return ids
@@ -1,73 +1,227 @@
+import asyncio
+import inspect
+import random
 from asyncio import sleep
-from time import time, sleep as sync_sleep
-from typing import Callable, List
+from functools import wraps
+from time import monotonic, sleep as sync_sleep
+from typing import Callable, Dict, List
+from weakref import WeakKeyDictionary
 
+from aiohttp import ClientConnectionError, ClientResponseError
 from logging_utils import logger
+from metrics import metrics
+from config.provider import configuration
 
 log = logger(__name__)
 
 
 class Backoff:
+    """
+    Exponential backoff with full jitter, every call gets its own instance
+    so a failure of one call never delays the others
+    """
 
-    _delay: float
-    _timestamp: int
+    _base_delay: float
+    _max_delay: float
+    _attempt: int = 0
 
-    def __init__(self, delay_in_seconds: float) -> None:
-        self._delay = delay_in_seconds
-        self._timestamp = time()
+    def __init__(self, base_delay_in_seconds: float = None, max_delay_in_seconds: float = None) -> None:
+        self._base_delay = base_delay_in_seconds or configuration.property(
+            "retry.base-delay-in-seconds", 1)
+        self._max_delay = max_delay_in_seconds or configuration.property(
+            "retry.max-delay-in-seconds", 30)
 
-    def set(self):
-        self._timestamp = time()
+    @property
+    def attempt(self) -> int:
+        return self._attempt
 
-    def is_expired(self) -> bool:
-        return time() > self._timestamp + self._delay
+    def next(self) -> float:
+        delay = random.uniform(
+            0, min(self._max_delay, self._base_delay * 2 ** self._attempt))
+        self._attempt += 1
+        return delay
 
 
-def async_retry(errors: List[Exception], backoff=Backoff(10)):
-    def _retry_wrapper(f: Callable):
-        async def _enclosed_function(*args: any, **kwargs: any) -> any:
+class RateLimiter:
+    """
+    Token bucket shared by every call to the same endpoint. The rate is halved
+    when the endpoint throttles or fails and slowly recovers on success,
+    waiters are queued on a lock and sleep exactly until the next token
+    """
+
+    _rate: float
+    _min_rate: float
+    _max_rate: float
+    _burst: float
+    _tokens: float
+    _updated_at: float
+    _paused_until: float = 0
+    _lock: asyncio.Lock
+
+    def __init__(self, rate: float, burst: float = None, min_rate: float = None, max_rate: float = None) -> None:
+        self._rate = rate
+        self._max_rate = max_rate or rate
+        self._min_rate = min(min_rate or rate / 20, self._max_rate)
+        self._burst = burst or max(1, rate)
+        self._tokens = self._burst
+        self._updated_at = monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    async def acquire(self):
+        async with self._lock:
             while True:
-                if backoff.is_expired():
+                now = monotonic()
+                self._tokens = min(
+                    self._burst, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await sleep(max(self._paused_until - now, (1 - self._tokens) / self._rate))
+
+    def succeeded(self):
+        self._rate = min(self._max_rate, self._rate + self._max_rate / 20)
+
+    def throttled(self, pause_in_seconds: float = 0):
+        self._rate = max(self._min_rate, self._rate / 2)
+        self._tokens = min(self._tokens, 0)
+        if pause_in_seconds:
+            self._paused_until = max(
+                self._paused_until, monotonic() + pause_in_seconds)
+
+
+_rate_limiters: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def rate_limiter(endpoint: str) -> RateLimiter:
+    """
+    Returns the limiter of the endpoint configured by rate-limits.<endpoint>,
+    limiters are kept per event loop since they hold asyncio primitives
+    """
+    limiters: Dict[str, RateLimiter] = _rate_limiters.setdefault(
+        asyncio.get_running_loop(), {})
+    limiter = limiters.get(endpoint, None)
+    if not limiter:
+        limiter = limiters[endpoint] = RateLimiter(configuration.property(f"rate-limits.{endpoint}.rate", 10),
+                                                   configuration.property(
+                                                       f"rate-limits.{endpoint}.burst"),
+                                                   configuration.property(
+                                                       f"rate-limits.{endpoint}.min-rate"),
+                                                   configuration.property(f"rate-limits.{endpoint}.max-rate"))
+    return limiter
+
+
+def _is_throttling(ex: Exception) -> bool:
+    if isinstance(ex, ClientResponseError):
+        return ex.status == 429 or ex.status >= 500
+    # NOTE: pooled keep-alive connections dropped by the server are as transient as timeouts
+    return isinstance(ex, (TimeoutError, ClientConnectionError))
+
+
+def _retry_after(ex: Exception) -> float:
+    try:
+        return float(ex.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def _is_retryable(ex: Exception, errors: List[Exception]) -> bool:
+    # NOTE: permanent client errors like 403 or 404 fail at once, only throttling responses are worth another attempt
+    if isinstance(ex, ClientResponseError) and not _is_throttling(ex):
+        return False
+    return any(isinstance(ex, error) for error in errors)
+
+
+def async_retry(errors: List[Exception], endpoint: str = None, max_attempts: int = None):
+    """
+    Retries coroutines and async generators. A failed generator is started
+    again with the same arguments, so it is expected to keep its progress in
+    them and resume where it stopped, backoff is reset once it made progress
+    """
+    def _retry_wrapper(f: Callable):
+        if inspect.isasyncgenfunction(f):
+            @wraps(f)
+            async def _enclosed_generator(*args: any, **kwargs: any) -> any:
+                attempts = max_attempts or configuration.property(
+                    "retry.max-attempts", 5)
+                backoff = Backoff()
+                while True:
+                    progressed = False
                     try:
-                        return await f(*args, **kwargs)
+                        async for item in f(*args, **kwargs):
+                            progressed = True
+                            yield item
+                        return
                     except Exception as ex:
-                        should_continue = False
-                        for error in errors:
-                            if isinstance(ex, error):
-                                backoff.set()
-                                await sleep(backoff._delay)
-                                log.warn("Retrying call of %s %s",
-                                         callable.__name__, str(ex))
-                                should_continue = True
-                                break
-                        if not should_continue:
+                        if progressed:
+                            backoff = Backoff()
+                        if not _is_retryable(ex, errors) or backoff.attempt + 1 >= attempts:
                             raise
-                else:
-                    await sleep(0.01)
+                        delay = backoff.next()
+                        log.warn("Resuming %s in %.2f seconds %s",
+                                 f.__name__, delay, str(ex))
+                        metrics.increment("crawl_retries_total")
+                        metrics.observe("crawl_backoff_wait_seconds", delay)
+                        await sleep(delay)
+            return _enclosed_generator
+
+        @wraps(f)
+        async def _enclosed_function(*args: any, **kwargs: any) -> any:
+            attempts = max_attempts or configuration.property(
+                "retry.max-attempts", 5)
+            limiter = rate_limiter(endpoint) if endpoint else None
+            backoff = Backoff()
+            while True:
+                if limiter:
+                    await limiter.acquire()
+                try:
+                    result = await f(*args, **kwargs)
+                    if limiter:
+                        limiter.succeeded()
+                    return result
+                except Exception as ex:
+                    if not _is_retryable(ex, errors) or backoff.attempt + 1 >= attempts:
+                        raise
+                    retry_after = _retry_after(ex)
+                    if limiter and _is_throttling(ex):
+                        limiter.throttled(retry_after)
+                    delay = max(retry_after, backoff.next())
+                    log.warn("Retrying call of %s in %.2f seconds %s",
+                             f.__name__, delay, str(ex))
+                    metrics.increment("crawl_retries_total")
+                    metrics.observe("crawl_backoff_wait_seconds", delay)
+                    await sleep(delay)
         return _enclosed_function
     return _retry_wrapper
 
 
-def retry(errors: List[Exception], backoff=Backoff(10)):
+def retry(errors: List[Exception], max_attempts: int = None):
     def _retry_wrapper(f: Callable):
+        if inspect.iscoroutinefunction(f) or inspect.isasyncgenfunction(f):
+            # NOTE: blocking sleep would stall the event loop and a coroutine fails
+            # only once awaited, so async callables get the async retry instead
+            return async_retry(errors, max_attempts=max_attempts)(f)
+
+        @wraps(f)
         def _enclosed_function(*args: any, **kwargs: any) -> any:
+            attempts = max_attempts or configuration.property(
+                "retry.max-attempts", 5)
+            backoff = Backoff()
             while True:
-                if backoff.is_expired():
-                    try:
-                        return f(*args, **kwargs)
-                    except Exception as ex:
-                        should_continue = False
-                        for error in errors:
-                            if isinstance(ex, error):
-                                backoff.set()
-                                sync_sleep(backoff._delay)
-                                log.warn("Retrying call of %s %s",
-                                         callable.__name__, str(ex))
-                                should_continue = True
-                                break
-                        if not should_continue:
-                            raise
-                else:
-                    sync_sleep(0.01)
+                try:
+                    return f(*args, **kwargs)
+                except Exception as ex:
+                    if not _is_retryable(ex, errors) or backoff.attempt + 1 >= attempts:
+                        raise
+                    delay = backoff.next()
+                    log.warn("Retrying call of %s in %.2f seconds %s",
+                             f.__name__, delay, str(ex))
+                    metrics.increment("crawl_retries_total")
+                    metrics.observe("crawl_backoff_wait_seconds", delay)
+                    sync_sleep(delay)
         return _enclosed_function
     return _retry_wrapper